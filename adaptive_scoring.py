@@ -0,0 +1,253 @@
+import math
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ffmpeg_process_factory import SegmentsLibVmafArguments
+from libvmaf import get_metric_types, get_vmaf_options
+from metrics import (
+    ADAPTIVE_BLOCKS_PER_STRIDE,
+    ADAPTIVE_MIN_BLOCK_SIZE,
+    FrameData,
+    get_confidence_interval,
+    load_frame_data,
+    METRIC_KEYS,
+    write_frame_log,
+)
+from utils import (
+    combine_resource_usage,
+    exit_program,
+    force_decimal_places,
+    get_metrics_list,
+    line,
+    Logger,
+    ResourceUsage,
+    run_ffmpeg,
+    Timer,
+    VideoInfoProvider,
+)
+
+log = Logger("adaptive_scoring")
+
+# The minimum number of blocks to score before the confidence interval is trusted.
+MIN_BLOCKS = 10
+# Each block is a separate pair of inputs, each with its own decoder, so the blocks of a round are split between
+# FFmpeg processes.
+MAX_BLOCKS_PER_PROCESS = 8
+
+
+def get_keyframe_interval(video_path, framerate: float, num_frames: int) -> int:
+    """The median number of frames from one keyframe to the next, or 1 if the video's keyframes are not flagged."""
+    keyframe_times = VideoInfoProvider(video_path).get_keyframe_times()
+
+    if not keyframe_times:
+        return 1
+
+    # With a single keyframe, every seek decodes from the start of the video.
+    if len(keyframe_times) == 1:
+        return num_frames
+
+    return round(np.median(np.diff(keyframe_times)) * framerate)
+
+
+def get_block_size(keyframe_interval: int) -> int:
+    """
+    Seeking to a block decodes the frames from the keyframe before it, so each block is at least as long as the
+    keyframe interval. Otherwise, a round would decode most of the video however few frames it scored.
+    """
+    return ADAPTIVE_MIN_BLOCK_SIZE * max(
+        1, math.ceil(keyframe_interval / ADAPTIVE_MIN_BLOCK_SIZE)
+    )
+
+
+def get_block_offsets() -> List[int]:
+    """
+    The offset of the block that is scored in each round, in blocks, in bit-reversed order (0, 4, 2, 6...),
+    so that each round fills the largest gaps left by the previous rounds.
+    """
+    num_bits = ADAPTIVE_BLOCKS_PER_STRIDE.bit_length() - 1
+
+    return [
+        int(f"{i:0{num_bits}b}"[::-1], 2) for i in range(ADAPTIVE_BLOCKS_PER_STRIDE)
+    ]
+
+
+def get_block_ranges(
+    offset: int, block_size: int, num_frames: int
+) -> List[Tuple[int, int]]:
+    """
+    The first frame and the frame after the last frame of each block that is scored in the round with this offset.
+    Each block includes the frame either side of it, as VMAF's motion feature compares each frame with its neighbours.
+    """
+    return [
+        (max(0, start - 1), min(start + block_size + 1, num_frames))
+        for start in range(
+            offset * block_size, num_frames, ADAPTIVE_BLOCKS_PER_STRIDE * block_size
+        )
+    ]
+
+
+def score_blocks(
+    block_ranges: List[Tuple[int, int]],
+    num_frames: int,
+    framerate: float,
+    transcode_output_path,
+    args,
+    log_file_path: Path,
+    reference,
+) -> Tuple[FrameData, Optional[ResourceUsage]]:
+    """
+    Score the blocks in one FFmpeg process, seeking to each block so that only the frames from the keyframe before it
+    are decoded. Return the scores, numbered with the frame numbers of the original video, and the resources used.
+    """
+    libvmaf_arguments = SegmentsLibVmafArguments(
+        reference.path,
+        transcode_output_path,
+        get_vmaf_options(args, log_file_path),
+        # Seek half a frame before the first frame, so that rounding never includes the frame before it.
+        [
+            (max(0, (first - 0.5) / framerate), end - first)
+            for first, end in block_ranges
+        ],
+        framerate,
+        reference.video_filters,
+    )
+
+    resource_usage = run_ffmpeg(
+        libvmaf_arguments.get_arguments(),
+        log_file_path.parent / "libvmaf_ffmpeg_log.txt",
+        args,
+    )
+
+    metric_keys = [METRIC_KEYS[metric_type] for metric_type in get_metrics_list(args)]
+    block_data = load_frame_data(str(log_file_path), metric_keys)
+    os.remove(log_file_path)
+
+    # libvmaf numbers the frames of the blocks from 0, so map them back to the frame numbers of the original video.
+    frame_numbers = np.concatenate(
+        [np.arange(first, end) for first, end in block_ranges]
+    )
+    # The number of frames is estimated from the duration, so the last block of the video may be shorter than expected.
+    last_first, last_end = block_ranges[-1]
+    missing_frames = len(frame_numbers) - len(block_data)
+
+    if missing_frames < 0 or (
+        missing_frames > 0
+        and (last_end != num_frames or missing_frames >= last_end - last_first)
+    ):
+        exit_program(
+            f"Expected {len(frame_numbers)} frames from the sampled blocks of {transcode_output_path}, "
+            f"but libvmaf scored {len(block_data)}. Is the frame rate constant?"
+        )
+
+    return (
+        FrameData.from_arrays(
+            frame_numbers[block_data.frame_numbers],
+            {key: block_data.get_scores(key) for key in metric_keys},
+        ),
+        resource_usage,
+    )
+
+
+def run_libvmaf_adaptive(
+    transcode_output_path,
+    args,
+    log_file_path,
+    reference,
+    message="",
+):
+    """
+    Score one block of frames in every ADAPTIVE_BLOCKS_PER_STRIDE blocks per round, until the 95% confidence interval
+    of the mean VMAF is narrower than ±args.vmaf_tolerance or every frame has been scored.
+    The blocks are as long as the keyframe interval of the videos, so each round only decodes about twice the frames
+    that it scores, and stopping early also saves most of the decoding.
+    The scored frames are written to log_file_path, with their frame numbers in the original video.
+    """
+    log_file_path = Path(log_file_path)
+    metric_keys = [METRIC_KEYS[metric_type] for metric_type in get_metrics_list(args)]
+    video_info = VideoInfoProvider(reference.path)
+    framerate = video_info.get_framerate_float()
+    num_frames = round(video_info.get_duration() * framerate)
+    block_size = get_block_size(
+        max(
+            get_keyframe_interval(video_path, framerate, num_frames)
+            for video_path in (reference.path, transcode_output_path)
+        )
+    )
+    frame_numbers = []
+    scores = {key: [] for key in metric_keys}
+    round_usages = []
+
+    line()
+    log.info(
+        f"Calculating the {get_metric_types(args)}{message}, until the 95% confidence interval "
+        f"of the mean VMAF is within ±{args.vmaf_tolerance}, "
+        f"{block_size} frames from every {ADAPTIVE_BLOCKS_PER_STRIDE * block_size} frames per round...\n"
+    )
+
+    timer = Timer()
+    timer.start()
+
+    # A video shorter than ADAPTIVE_BLOCKS_PER_STRIDE blocks has no blocks at the larger offsets.
+    offsets = [
+        offset for offset in get_block_offsets() if offset * block_size < num_frames
+    ]
+
+    for round_number, offset in enumerate(offsets, 1):
+        block_ranges = get_block_ranges(offset, block_size, num_frames)
+
+        for first_block in range(0, len(block_ranges), MAX_BLOCKS_PER_PROCESS):
+            block_data, usage = score_blocks(
+                block_ranges[first_block : first_block + MAX_BLOCKS_PER_PROCESS],
+                num_frames,
+                framerate,
+                transcode_output_path,
+                args,
+                log_file_path.with_name(
+                    f"{log_file_path.stem}_round{round_number}_{first_block}{log_file_path.suffix}"
+                ),
+                reference,
+            )
+            round_usages.append(usage)
+
+            # Discard the frames either side of each block.
+            in_block = (
+                block_data.frame_numbers // block_size
+            ) % ADAPTIVE_BLOCKS_PER_STRIDE == offset
+
+            frame_numbers.append(block_data.frame_numbers[in_block])
+            for key in metric_keys:
+                scores[key].append(block_data.get_scores(key)[in_block])
+
+        scored_frame_numbers = np.concatenate(frame_numbers)
+        vmaf_scores = np.concatenate(scores["vmaf"])
+        confidence_interval = (
+            0.0
+            if len(scored_frame_numbers) == num_frames
+            else get_confidence_interval(scored_frame_numbers, vmaf_scores, block_size)
+        )
+
+        log.info(
+            f"Round {round_number}: {len(vmaf_scores)} frames scored, "
+            f"mean VMAF: {np.mean(vmaf_scores):.3f} ± {confidence_interval:.3f}"
+        )
+
+        num_blocks = len(np.unique(scored_frame_numbers // block_size))
+        if num_blocks >= MIN_BLOCKS and confidence_interval <= args.vmaf_tolerance:
+            break
+
+    order = np.argsort(scored_frame_numbers, kind="stable")
+    write_frame_log(
+        FrameData.from_arrays(
+            scored_frame_numbers[order],
+            {key: np.concatenate(scores[key])[order] for key in metric_keys},
+        ),
+        str(log_file_path),
+    )
+
+    time_taken = timer.elapsed()
+    log.info(f"Time Taken: {force_decimal_places(time_taken, args.decimal_places)}s")
+
+    return combine_resource_usage(round_usages, time_taken, concurrent=False)
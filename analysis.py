@@ -0,0 +1,139 @@
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+from prettytable import PrettyTable
+
+from manifest import MANIFEST_FILENAME
+from sweep import SweepResult
+from utils import exit_program, force_decimal_places
+
+
+def get_dominating_indices(costs: np.ndarray) -> np.ndarray:
+    """
+    For each row of costs (one row per value, one column per cost, lower is better), return the index of a row
+    that dominates it, i.e. is no worse in every column and better in at least one, or -1 if it is Pareto optimal.
+    """
+    # Compare every row with every other row at once: no_worse[i, j] is True if row j is no worse than row i.
+    no_worse = np.all(costs[np.newaxis, :, :] <= costs[:, np.newaxis, :], axis=2)
+    better = np.any(costs[np.newaxis, :, :] < costs[:, np.newaxis, :], axis=2)
+    dominated_by = no_worse & better
+
+    return np.where(dominated_by.any(axis=1), dominated_by.argmax(axis=1), -1)
+
+
+def mark_pareto_frontier(
+    table: PrettyTable, results: List[SweepResult], include_time: bool = True
+) -> None:
+    """
+    Add a column that shows whether each value is on the Pareto frontier of bitrate, VMAF and encoding time,
+    or which value beats it on all of them. If include_time is False, the encoding time is left out.
+    """
+    if not results:
+        return
+
+    costs = np.array(
+        [
+            [result.bitrate, -result.vmaf_mean]
+            + ([result.time_taken] if include_time else [])
+            for result in results
+        ]
+    )
+
+    table.add_column(
+        "Pareto",
+        [
+            "optimal" if index == -1 else f"dominated by {results[index].label}"
+            for index in get_dominating_indices(costs)
+        ],
+    )
+
+
+def load_results(path: str) -> List[SweepResult]:
+    """Load the results of another sweep from its output folder or its manifest."""
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST_FILENAME)
+
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as error:
+        exit_program(f"Unable to load the results to compare with: {error}")
+
+    return [SweepResult.from_dict(result) for result in manifest["results"].values()]
+
+
+def get_curve(results: List[SweepResult]) -> Optional[np.ndarray]:
+    """The log of the bitrate and the VMAF of each result, sorted by bitrate."""
+    curve = np.array(
+        [
+            [np.log(result.bitrate), result.vmaf_mean]
+            for result in results
+            if result.bitrate > 0 and "VMAF" in result.metric_scores
+        ]
+    )
+
+    # At least two points are needed to fit a curve.
+    if len(curve) < 2:
+        return None
+
+    return curve[np.argsort(curve[:, 0])]
+
+
+def get_bd_difference(
+    anchor_x: np.ndarray,
+    anchor_y: np.ndarray,
+    test_x: np.ndarray,
+    test_y: np.ndarray,
+) -> Optional[float]:
+    """
+    The Bjøntegaard delta: the mean difference between the test and anchor curves of y against x,
+    over the range of x that both curves cover. Each curve is fitted with a polynomial of up to 3rd order.
+    """
+    low = max(anchor_x.min(), test_x.min())
+    high = min(anchor_x.max(), test_x.max())
+
+    if low >= high:
+        return None
+
+    integrals = []
+    for x, y in ((anchor_x, anchor_y), (test_x, test_y)):
+        degree = min(3, len(x) - 1)
+        integral = np.polyint(np.polyfit(x, y, degree))
+        integrals.append(np.polyval(integral, high) - np.polyval(integral, low))
+
+    return (integrals[1] - integrals[0]) / (high - low)
+
+
+def compare_sweeps(
+    results: List[SweepResult],
+    anchor_results: List[SweepResult],
+    anchor_path: str,
+    decimal_places: int,
+) -> str:
+    """Calculate the BD-rate and BD-VMAF of this sweep, relative to the anchor sweep."""
+    curve = get_curve(results)
+    anchor_curve = get_curve(anchor_results)
+
+    if curve is None or anchor_curve is None:
+        return f"At least two VMAF results are needed in both sweeps to compare with {anchor_path}."
+
+    # The change in log bitrate for the same VMAF, and the change in VMAF for the same bitrate.
+    bd_log_rate = get_bd_difference(
+        anchor_curve[:, 1], anchor_curve[:, 0], curve[:, 1], curve[:, 0]
+    )
+    bd_vmaf = get_bd_difference(
+        anchor_curve[:, 0], anchor_curve[:, 1], curve[:, 0], curve[:, 1]
+    )
+
+    if bd_log_rate is None or bd_vmaf is None:
+        return f"The bitrates or VMAF scores of this sweep do not overlap with those of {anchor_path}."
+
+    bd_rate = (np.exp(bd_log_rate) - 1) * 100
+
+    return (
+        f"Compared with {anchor_path}:\n"
+        f"BD-rate: {force_decimal_places(bd_rate, decimal_places)}% (the change in bitrate for the same VMAF)\n"
+        f"BD-VMAF: {force_decimal_places(bd_vmaf, decimal_places)} (the change in VMAF for the same bitrate)"
+    )
@@ -31,6 +31,117 @@ general_args.add_argument(
     help="The number of decimal places to use for the data in the table",
 )
 
+# Number of values/combinations to process concurrently.
+general_args.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=1,
+    help="The number of values (or combinations) to transcode and analyse concurrently.\n"
+    "The CPU cores are divided between the jobs, i.e. each job's encoder and libvmaf get an equal share of the cores.\n"
+    "The rows of the table are still written in the order that the values were specified.",
+)
+
+# Measure the resources used by each FFmpeg process.
+general_args.add_argument(
+    "--resource-usage",
+    action="store_true",
+    help="Measure the CPU user and system time, peak memory (RSS) and frames per second of each transcode and libvmaf run,\n"
+    "and add them to the table and the manifest. Progress bars are not shown, as the resources used by FFmpeg can only be\n"
+    "measured if VQM waits for it. Cannot be used with --batch-scoring or --single-pass.",
+)
+
+# Distribute the jobs to worker processes.
+general_args.add_argument(
+    "--queue",
+    type=str,
+    default=None,
+    metavar="<path>",
+    help="Add the values (or combinations) to a job queue in this SQLite database instead of running them, and wait for\n"
+    "worker processes to run them. Start any number of workers, on this machine or others that share the same storage, with:\n"
+    "python main.py worker --queue <path>\n"
+    "Cannot be used with --jobs, --pipeline, --batch-scoring or --target-vmaf.",
+)
+
+# Overlap the transcode of the next value with the quality metrics calculation of the previous value.
+general_args.add_argument(
+    "--pipeline",
+    action="store_true",
+    help="Transcode the next value while the quality metrics of the previous value are being calculated.\n"
+    "The CPU cores are divided between the encoder and libvmaf. Cannot be used with --jobs.",
+)
+
+# The maximum number of transcoded files waiting to be scored when pipelining.
+general_args.add_argument(
+    "--max-pending-encodes",
+    type=int,
+    default=1,
+    help="Only applicable with --pipeline. The maximum number of transcoded files that can wait for their quality metrics to be calculated.",
+)
+
+# Stream the encoder's output straight into libvmaf.
+general_args.add_argument(
+    "--single-pass",
+    action="store_true",
+    help="Pipe the encoder's output (Matroska) straight into libvmaf instead of writing each transcode to disk and reading it back.\n"
+    "The size and bitrate are measured from the bytes that pass through the pipe. Cannot be used with --pipeline.",
+)
+
+# Persistent result cache.
+general_args.add_argument(
+    "--result-cache",
+    type=str,
+    default=None,
+    metavar="<folder>",
+    help="Cache the results of each transcode in the specified folder and reuse them in later runs.\n"
+    "A result is reused if the input video, encoder, encoder options, parameter value or combination,\n"
+    "video filters, VMAF model, n_subsample and phone model setting are the same.",
+)
+
+# The maximum size of the result cache.
+general_args.add_argument(
+    "--result-cache-size",
+    type=int,
+    default=1000,
+    metavar="<MB>",
+    help="The maximum size of the result cache in MB. The least recently used results are removed first. Default: 1000",
+)
+
+# Resume an interrupted sweep.
+general_args.add_argument(
+    "--resume",
+    action="store_true",
+    help="Resume an interrupted run. The results of the values that were completed are loaded from manifest.json\n"
+    "in the output folder, and only the missing values are transcoded and analysed.",
+)
+
+# Skip the graphs.
+general_args.add_argument(
+    "--no-graphs",
+    action="store_true",
+    help="Do not create any graphs. Only the table is created, which makes each run faster.",
+)
+
+# The maximum number of points in each per-frame graph.
+general_args.add_argument(
+    "--graph-points",
+    type=int,
+    default=4000,
+    metavar="<n>",
+    help="The maximum number of points plotted in each per-frame graph. Longer videos are downsampled by keeping the\n"
+    "lowest and highest score of each group of frames, so dips in quality are still visible. 0 plots every frame. Default: 4000",
+)
+
+# Another sweep to compare this one with.
+general_args.add_argument(
+    "--compare-with",
+    type=str,
+    default=None,
+    metavar="<folder>",
+    help="The output folder (or manifest.json) of another run, e.g. with a different encoder or preset.\n"
+    "The BD-rate and BD-VMAF of this run relative to the other run are added to the end of the table.",
+)
+
 # Input Video
 general_args.add_argument(
     "-i",
@@ -97,6 +208,54 @@ encoder_args.add_argument(
     "--encoder-options='-crf 18 -x264-params keyint=123:min-keyint=20'",
 )
 
+# Encoder threads
+encoder_args.add_argument(
+    "--encoder-threads",
+    type=int,
+    default=None,
+    help="Set the number of threads used by the encoder (FFmpeg's -threads option).\n"
+    "Without this argument, the encoder decides, unless --jobs is greater than 1, in which case each job gets an equal share of the CPU cores.",
+)
+
+# Chunked encoding
+encoder_args.add_argument(
+    "--encode-chunks",
+    type=int,
+    default=1,
+    metavar="<n>",
+    help="Split the video into n chunks at the keyframes closest to evenly spaced points, encode the chunks in parallel\n"
+    "FFmpeg processes and join them without re-encoding. This speeds up slow encoder settings that do not use every core.\n"
+    "The encoder threads (all of the CPU cores, --encoder-threads or each job's share with --jobs) are divided between the chunks.\n"
+    "The Encoding Time column shows the time taken followed by the CPU time of every process. Cannot be used with --single-pass.",
+)
+
+# Benchmark the encoder
+encoder_args.add_argument(
+    "--benchmark-runs",
+    type=int,
+    default=None,
+    metavar="<k>",
+    help="Encode each value (or combination) k times to measure the encoding speed, and score the last encode once.\n"
+    "The Encoding Time and Encoding FPS columns show the median of the k runs, followed by the range.\n"
+    "Cannot be used with --jobs, --pipeline, --encode-chunks or --single-pass, as they run other processes at the same time.",
+)
+
+encoder_args.add_argument(
+    "--benchmark-warmup",
+    action="store_true",
+    help="With --benchmark-runs, encode each value once more before the timed runs and discard that run,\n"
+    "so that the timed runs are not slowed down by reading the input video from disk for the first time.",
+)
+
+encoder_args.add_argument(
+    "--cpu-set",
+    type=str,
+    default=None,
+    metavar="<cpus>",
+    help="With --benchmark-runs, only let the encoder run on these CPUs, in the format used by taskset -c, e.g. 0-3,8.\n"
+    "This makes the runs more repeatable, as the encoder is not moved between cores of different speeds. Linux only.",
+)
+
 # Encoder Parameter
 encoder_args.add_argument(
     "-p",
@@ -116,6 +275,28 @@ encoder_args.add_argument(
     "Compare h264_amf quality levels: -p quality -v balanced speed",
 )
 
+# Search for the value that achieves a target VMAF.
+encoder_args.add_argument(
+    "--target-vmaf",
+    type=float,
+    default=None,
+    metavar="<score>",
+    help="Instead of comparing the values specified with -v, search --range for the value of the -p parameter that achieves\n"
+    "this VMAF score. The search assumes that the VMAF changes steadily with the value (e.g. CRF) and usually needs 4-5 transcodes.\n"
+    "Every value that is tried is added to the table. Cannot be used with --jobs or --batch-scoring, as the values are tried one at a time.\n"
+    "Example: --target-vmaf 93 -p crf --range 15 35",
+)
+
+# The range of values to search.
+encoder_args.add_argument(
+    "--range",
+    type=int,
+    nargs=2,
+    default=None,
+    metavar=("<low>", "<high>"),
+    help="The lowest and highest (integer) values of the -p parameter to search when using --target-vmaf.",
+)
+
 # Combination Mode
 encoder_args.add_argument(
     "-c",
@@ -150,6 +331,70 @@ overview_mode_args.add_argument(
     "Overview Mode creates a lossless overview video by grabbing a --clip-length long segment every X seconds from the original video.\nSpecify a value for X (in the range 1-600)",
 )
 
+# Only use the most representative clips in Overview Mode.
+overview_mode_args.add_argument(
+    "--stratified-clips",
+    type=int,
+    default=None,
+    metavar="<n>",
+    help="Only applicable in Overview Mode. Instead of using every clip, analyse the scene changes of the video once\n"
+    "and use the n clips that best cover the range of content complexity, from static scenes to high motion.\n"
+    "This gives a similar overall VMAF with far fewer frames to transcode and analyse.",
+)
+
+# Chunk-parallel scoring.
+vmaf_args.add_argument(
+    "--vmaf-chunks",
+    type=int,
+    default=1,
+    metavar="<n>",
+    help="Split each transcode into n ranges of frames and calculate the metrics of each range in a separate FFmpeg process,\n"
+    "in parallel. The --n-threads are divided between the processes. The scores are identical to scoring the whole video at once,\n"
+    "but the frame rate must be constant. Cannot be used with -n, --vmaf-tolerance, --batch-scoring or --single-pass.",
+)
+
+# Adaptive scoring.
+vmaf_args.add_argument(
+    "--vmaf-tolerance",
+    type=float,
+    default=None,
+    metavar="<x>",
+    help="Score the frames in rounds, each round adding a block of frames from every part of the video, and stop once the\n"
+    "95%% confidence interval of the mean VMAF is within ±x (e.g. 0.25). The interval is shown after the mean in the table.\n"
+    "The frame rate must be constant. Cannot be used with -n, --batch-scoring or --single-pass.",
+)
+
+# Score every transcode in one FFmpeg process.
+vmaf_args.add_argument(
+    "--batch-scoring",
+    action="store_true",
+    help="Transcode every value first, then calculate the quality metrics of all of the transcodes in a single FFmpeg process.\n"
+    "The reference is decoded (and filtered) only once and split between one libvmaf instance per transcode.\n"
+    "Cannot be used with --jobs, --pipeline or --single-pass.",
+)
+
+# libvmaf log format
+vmaf_args.add_argument(
+    "--log-format",
+    type=str,
+    choices=["json", "csv", "xml"],
+    default="json",
+    help="The format of the per-frame metrics file written by libvmaf. Default: json\n"
+    "csv is the most compact and the quickest to parse. Every format is parsed one frame at a time.",
+)
+
+# Decode and filter the reference once.
+vmaf_args.add_argument(
+    "--cache-reference",
+    type=str,
+    choices=["ffv1", "rawvideo"],
+    default=None,
+    help="Decode the reference video and apply --video-filters to it only once, rather than once per libvmaf run.\n"
+    "ffv1: a lossless FFV1 intermediate (smaller).\n"
+    "rawvideo: uncompressed frames (largest, but the cheapest to read).\n"
+    "The cache is stored in the output folder and is rebuilt if the input video or the filters change.",
+)
+
 # libvmaf n_subsample
 vmaf_args.add_argument(
     "-n",
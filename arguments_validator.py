@@ -1,5 +1,6 @@
 import os
-import requests
+
+from utils import parse_cpu_set
 
 
 class ArgumentsValidator:
@@ -11,6 +12,78 @@ class ArgumentsValidator:
         validation_results.append(
             self.__validate_original_video_exists(args.input_video)
         )
+        validation_results.append(self.__validate_jobs(args.jobs))
+        validation_results.append(
+            self.__validate_pipeline(
+                args.pipeline, args.jobs, args.max_pending_encodes, args.single_pass
+            )
+        )
+        validation_results.append(
+            self.__validate_batch_scoring(
+                args.batch_scoring, args.jobs, args.pipeline, args.single_pass
+            )
+        )
+
+        validation_results.append(self.__validate_graph_points(args.graph_points))
+        validation_results.append(
+            self.__validate_resource_usage(
+                args.resource_usage, args.batch_scoring, args.single_pass
+            )
+        )
+        validation_results.append(
+            self.__validate_queue(
+                args.queue,
+                args.jobs,
+                args.pipeline,
+                args.batch_scoring,
+                args.target_vmaf,
+            )
+        )
+        validation_results.append(
+            self.__validate_encode_chunks(args.encode_chunks, args.single_pass)
+        )
+        validation_results.append(
+            self.__validate_benchmark(
+                args.benchmark_runs,
+                args.benchmark_warmup,
+                args.cpu_set,
+                args.jobs,
+                args.pipeline,
+                args.encode_chunks,
+                args.single_pass,
+            )
+        )
+        validation_results.append(
+            self.__validate_vmaf_chunks(
+                args.vmaf_chunks,
+                args.n_subsample,
+                args.vmaf_tolerance,
+                args.batch_scoring,
+                args.single_pass,
+            )
+        )
+        validation_results.append(
+            self.__validate_vmaf_tolerance(
+                args.vmaf_tolerance,
+                args.n_subsample,
+                args.batch_scoring,
+                args.single_pass,
+            )
+        )
+        validation_results.append(
+            self.__validate_stratified_clips(args.stratified_clips, args.interval)
+        )
+        validation_results.append(
+            self.__validate_target_vmaf(
+                args.target_vmaf,
+                args.range,
+                args.parameter,
+                args.values,
+                args.combinations,
+                args.batch_scoring,
+                args.jobs,
+            )
+        )
 
         for validation_tuple in validation_results:
             if not validation_tuple[0]:
@@ -20,7 +93,230 @@ class ArgumentsValidator:
         return result, validation_errors
 
     def __validate_original_video_exists(self, input_video):
+        if os.path.exists(input_video):
+            return True, None
+
+        # Only import requests if the input is not a local file, as it is slow to import.
+        import requests
+
         return (
-            os.path.exists(input_video) or requests.get(input_video).ok,
+            requests.get(input_video).ok,
             f"Unable to find {input_video}",
         )
+
+    def __validate_jobs(self, jobs):
+        return (
+            jobs >= 1,
+            f"The number of jobs must be at least 1, but {jobs} was specified",
+        )
+
+    def __validate_pipeline(self, pipeline, jobs, max_pending_encodes, single_pass):
+        if not pipeline:
+            return True, None
+
+        if jobs > 1:
+            return False, "--pipeline cannot be used in conjunction with --jobs"
+
+        if single_pass:
+            return False, "--pipeline cannot be used in conjunction with --single-pass"
+
+        return (
+            max_pending_encodes >= 1,
+            f"--max-pending-encodes must be at least 1, but {max_pending_encodes} was specified",
+        )
+
+    def __validate_batch_scoring(self, batch_scoring, jobs, pipeline, single_pass):
+        return (
+            not batch_scoring or (jobs == 1 and not pipeline and not single_pass),
+            "--batch-scoring cannot be used in conjunction with --jobs, --pipeline or --single-pass",
+        )
+
+    def __validate_graph_points(self, graph_points):
+        return (
+            graph_points == 0 or graph_points >= 4,
+            f"--graph-points must be 0 or at least 4, but {graph_points} was specified",
+        )
+
+    def __validate_stratified_clips(self, stratified_clips, interval):
+        if stratified_clips is None:
+            return True, None
+
+        if interval is None:
+            return (
+                False,
+                "--stratified-clips can only be used in Overview Mode (--interval)",
+            )
+
+        return (
+            stratified_clips >= 1,
+            f"--stratified-clips must be at least 1, but {stratified_clips} was specified",
+        )
+
+    def __validate_target_vmaf(
+        self,
+        target_vmaf,
+        value_range,
+        parameter,
+        values,
+        combinations,
+        batch_scoring,
+        jobs,
+    ):
+        if target_vmaf is None:
+            return value_range is None, "--range can only be used with --target-vmaf"
+
+        if not parameter or values or combinations:
+            return (
+                False,
+                "--target-vmaf must be used with -p, and cannot be used with -v or -c",
+            )
+
+        if value_range is None or value_range[0] >= value_range[1]:
+            return (
+                False,
+                "--target-vmaf requires --range <low> <high>, where low is less than high",
+            )
+
+        # Each value that is tried depends on the results of the previous ones, so they are transcoded one at a time.
+        if batch_scoring or jobs > 1:
+            return (
+                False,
+                "--target-vmaf cannot be used in conjunction with --batch-scoring or --jobs",
+            )
+
+        return (
+            0 < target_vmaf <= 100,
+            f"--target-vmaf must be between 0 and 100, but {target_vmaf} was specified",
+        )
+
+    def __validate_vmaf_tolerance(
+        self, vmaf_tolerance, n_subsample, batch_scoring, single_pass
+    ):
+        if vmaf_tolerance is None:
+            return True, None
+
+        if n_subsample not in (None, "1", 1) or batch_scoring or single_pass:
+            return (
+                False,
+                "--vmaf-tolerance cannot be used in conjunction with -n, --batch-scoring or --single-pass",
+            )
+
+        return (
+            vmaf_tolerance > 0,
+            f"--vmaf-tolerance must be greater than 0, but {vmaf_tolerance} was specified",
+        )
+
+    def __validate_vmaf_chunks(
+        self, vmaf_chunks, n_subsample, vmaf_tolerance, batch_scoring, single_pass
+    ):
+        if vmaf_chunks < 1:
+            return (
+                False,
+                f"--vmaf-chunks must be at least 1, but {vmaf_chunks} was specified",
+            )
+
+        if vmaf_chunks > 1 and (
+            n_subsample not in (None, "1", 1)
+            or vmaf_tolerance is not None
+            or batch_scoring
+            or single_pass
+        ):
+            return (
+                False,
+                "--vmaf-chunks cannot be used in conjunction with -n, --vmaf-tolerance, --batch-scoring or --single-pass",
+            )
+
+        return True, None
+
+    def __validate_encode_chunks(self, encode_chunks, single_pass):
+        if encode_chunks < 1:
+            return (
+                False,
+                f"--encode-chunks must be at least 1, but {encode_chunks} was specified",
+            )
+
+        if encode_chunks > 1 and single_pass:
+            return (
+                False,
+                "--encode-chunks cannot be used in conjunction with --single-pass",
+            )
+
+        return True, None
+
+    def __validate_benchmark(
+        self,
+        benchmark_runs,
+        benchmark_warmup,
+        cpu_set,
+        jobs,
+        pipeline,
+        encode_chunks,
+        single_pass,
+    ):
+        if benchmark_runs is None:
+            return (
+                not (benchmark_warmup or cpu_set),
+                "--benchmark-warmup and --cpu-set can only be used with --benchmark-runs",
+            )
+
+        if benchmark_runs < 1:
+            return (
+                False,
+                f"--benchmark-runs must be at least 1, but {benchmark_runs} was specified",
+            )
+
+        if jobs > 1 or pipeline or encode_chunks > 1 or single_pass:
+            return (
+                False,
+                "--benchmark-runs cannot be used in conjunction with --jobs, --pipeline, --encode-chunks or --single-pass",
+            )
+
+        # The FPS of each run is measured from the resources used by the encoder.
+        if not hasattr(os, "wait4"):
+            return False, "--benchmark-runs is not supported on this platform"
+
+        if cpu_set is None:
+            return True, None
+
+        if not hasattr(os, "sched_setaffinity"):
+            return False, "--cpu-set is only supported on Linux"
+
+        try:
+            cpus = parse_cpu_set(cpu_set)
+        except ValueError:
+            cpus = set()
+
+        if not cpus:
+            return (
+                False,
+                f"--cpu-set must be a list of CPUs such as 0-3,8, but {cpu_set} was specified",
+            )
+
+        unavailable_cpus = cpus - os.sched_getaffinity(0)
+        return (
+            not unavailable_cpus,
+            f"These CPUs in --cpu-set are not available: {sorted(unavailable_cpus)}",
+        )
+
+    def __validate_queue(self, queue, jobs, pipeline, batch_scoring, target_vmaf):
+        if queue is None:
+            return True, None
+
+        if jobs > 1 or pipeline or batch_scoring or target_vmaf is not None:
+            return (
+                False,
+                "--queue cannot be used in conjunction with --jobs, --pipeline, --batch-scoring or --target-vmaf",
+            )
+
+        queue_folder = os.path.dirname(os.path.abspath(queue))
+        return (
+            os.path.isdir(queue_folder),
+            f"The folder of the --queue database does not exist: {queue_folder}",
+        )
+
+    def __validate_resource_usage(self, resource_usage, batch_scoring, single_pass):
+        # In these modes, an FFmpeg process scores several values, or both encodes and scores a value.
+        return (
+            not (resource_usage and (batch_scoring or single_pass)),
+            "--resource-usage cannot be used in conjunction with --batch-scoring or --single-pass",
+        )
@@ -0,0 +1,540 @@
+"""
+Measure the time taken and the peak memory used by each stage of VQM's pipeline on synthetic videos, and compare them
+with a baseline. Only FFmpeg is needed, as the videos are generated with its lavfi sources.
+
+python benchmark.py                    Compare with benchmark_baseline.json, or create it if it does not exist.
+python benchmark.py --update-baseline  Replace the baseline with the results of this run.
+
+The exit code is 1 if any stage regressed past the thresholds.
+"""
+
+import argparse
+from dataclasses import asdict, dataclass
+import json
+import os
+from pathlib import Path
+import pickle
+import platform
+import resource
+from statistics import median
+import subprocess
+import sys
+from time import perf_counter
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prettytable import PrettyTable
+
+from args import parser
+from libvmaf import run_libvmaf
+from metrics import FRAME_COLUMNS_FOLDER, FrameData, plot_metric_graphs, process_metrics
+from overview import create_overview_video
+from reference_cache import prepare_reference
+from transcode_video import transcode_video
+from utils import (
+    cut_video,
+    exit_program,
+    force_decimal_places,
+    get_peak_rss,
+    GraphRenderer,
+    line,
+    Logger,
+    VideoInfoProvider,
+)
+
+log = Logger("benchmark")
+
+FRAMERATE = 24
+CRF = "23"
+# Overview Mode takes a 1 second clip every OVERVIEW_INTERVAL seconds.
+OVERVIEW_INTERVAL = 2
+# A stage has not regressed if it is slower by less than this many seconds, as short stages vary a lot between runs.
+MIN_TIME_INCREASE = 0.1
+# Likewise for the memory used, in bytes, as stages that use little memory vary by a few MB between runs.
+MIN_MEMORY_INCREASE = 10_000_000
+
+STAGES = ["probe", "cut", "overview", "encode", "libvmaf", "parse", "plot"]
+
+
+@dataclass
+class BenchmarkCase:
+    # The lavfi source that generates the video.
+    source: str
+    size: str
+    # Seconds
+    duration: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.source}_{self.size}_{self.duration}s"
+
+
+CASES = [
+    BenchmarkCase("testsrc2", "640x360", 10),
+    BenchmarkCase("mandelbrot", "640x360", 10),
+    BenchmarkCase("testsrc2", "1280x720", 20),
+    BenchmarkCase("mandelbrot", "1920x1080", 10),
+]
+
+
+@dataclass
+class StageResult:
+    # Seconds
+    time_taken: float
+    # Bytes. How far the peak RSS of the stage, or of the largest FFmpeg process it ran, rose above the RSS at the start.
+    peak_rss: int
+
+
+def generate_source(case: BenchmarkCase, sources_folder: str) -> str:
+    """Generate the video for the case, unless it was generated by a previous run."""
+    source_path = os.path.join(sources_folder, f"{case.name}.mp4")
+
+    if os.path.exists(source_path):
+        return source_path
+
+    os.makedirs(sources_folder, exist_ok=True)
+    log.info(f"Generating {source_path}...")
+    # Write to a temporary file first so that an interrupted run never leaves a partial video behind.
+    partial_path = f"{source_path}.partial.mp4"
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"{case.source}=size={case.size}:rate={FRAMERATE}",
+            "-t",
+            str(case.duration),
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-crf",
+            "12",
+            "-pix_fmt",
+            "yuv420p",
+            partial_path,
+        ],
+        check=True,
+    )
+    os.replace(partial_path, source_path)
+
+    return source_path
+
+
+def run_stage(name: str, function: Callable, *arguments) -> Tuple[object, StageResult]:
+    """
+    Run function in a child process, so that the peak RSS of each stage is measured separately.
+    Return the result of the function and the resources used by the stage.
+
+    The forked child starts with the parent's RSS, and a process started by the child starts with the child's RSS
+    at that time, so the peak RSS is measured as the rise above the RSS that the child started with.
+    The processes that the child waited for only report their own peak, so it is the peak of the largest process,
+    not the sum of the processes.
+    """
+    read_fd, write_fd = os.pipe()
+    start_time = perf_counter()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        exit_code = 0
+        start_rss = get_peak_rss(resource.getrusage(resource.RUSAGE_SELF))
+
+        try:
+            result = function(*arguments)
+            peak_rss = max(
+                get_peak_rss(resource.getrusage(resource.RUSAGE_SELF)),
+                get_peak_rss(resource.getrusage(resource.RUSAGE_CHILDREN)),
+            )
+            output = pickle.dumps((result, max(0, peak_rss - start_rss)))
+        except BaseException:
+            traceback.print_exc()
+            output = b""
+            exit_code = 1
+
+        with os.fdopen(write_fd, "wb") as f:
+            f.write(output)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f:
+        output = f.read()
+
+    _, status = os.waitpid(pid, 0)
+    time_taken = perf_counter() - start_time
+
+    if os.waitstatus_to_exitcode(status) != 0:
+        exit_program(f"The {name} stage failed.")
+
+    result, peak_rss = pickle.loads(output)
+
+    return result, StageResult(time_taken, peak_rss)
+
+
+def probe(video_path: str) -> Tuple[str, str, float]:
+    provider = VideoInfoProvider(video_path)
+    return (
+        provider.get_framerate_fraction(),
+        provider.get_bitrate(3),
+        provider.get_duration(),
+    )
+
+
+def plot(columns_folder: str, metric_scores, args, output_folder: str) -> None:
+    graph_renderer = GraphRenderer()
+    plot_metric_graphs(
+        graph_renderer,
+        FrameData.load(columns_folder),
+        metric_scores,
+        args,
+        output_folder,
+    )
+    graph_renderer.join()
+
+
+def run_pipeline(
+    case: BenchmarkCase, source_path: str, output_folder: str
+) -> Dict[str, StageResult]:
+    """
+    Run each stage of a sweep of one CRF value. Cut and Overview Mode cannot be used together,
+    so both are run on the source video and the cut video is encoded.
+    """
+    args = parser.parse_args(
+        [
+            "-i",
+            source_path,
+            "-o",
+            output_folder,
+            "-p",
+            "crf",
+            "-v",
+            CRF,
+            "-t",
+            str(case.duration),
+        ]
+    )
+    job_folder = os.path.join(output_folder, f"crf_{CRF}")
+    transcode_path = os.path.join(job_folder, f"{CRF}.mkv")
+    log_file_path = os.path.join(job_folder, f"per_frame_metrics.{args.log_format}")
+    os.makedirs(job_folder, exist_ok=True)
+
+    stage_results = {}
+
+    def stage(name: str, function: Callable, *arguments):
+        output, stage_results[name] = run_stage(name, function, *arguments)
+        return output
+
+    stage("probe", probe, source_path)
+    cut_path = stage(
+        "cut",
+        cut_video,
+        Path(source_path).name,
+        args,
+        ".mkv",
+        output_folder,
+        os.path.join(output_folder, "metrics_table.txt"),
+    )
+    stage(
+        "overview",
+        create_overview_video,
+        source_path,
+        output_folder,
+        OVERVIEW_INTERVAL,
+        "1",
+    )
+    stage(
+        "encode",
+        transcode_video,
+        cut_path,
+        args,
+        CRF,
+        transcode_path,
+        f"Transcoding the video using '-crf {CRF}'",
+    )
+    stage(
+        "libvmaf",
+        run_libvmaf,
+        transcode_path,
+        args,
+        log_file_path,
+        prepare_reference(cut_path, output_folder, args),
+    )
+    metric_scores = stage(
+        "parse",
+        process_metrics,
+        log_file_path,
+        args,
+        job_folder,
+        args.decimal_places,
+    )
+    stage(
+        "plot",
+        plot,
+        os.path.join(job_folder, FRAME_COLUMNS_FOLDER),
+        metric_scores,
+        args,
+        job_folder,
+    )
+
+    return stage_results
+
+
+def benchmark_case(
+    case: BenchmarkCase, output_folder: str, repeats: int
+) -> Dict[str, StageResult]:
+    """The median time taken and peak RSS of each stage over the repeats."""
+    source_path = generate_source(case, os.path.join(output_folder, "sources"))
+    runs = []
+
+    for repeat in range(1, repeats + 1):
+        line()
+        log.info(f"Benchmarking {case.name} (run {repeat} of {repeats})...")
+        runs.append(
+            run_pipeline(case, source_path, os.path.join(output_folder, case.name))
+        )
+
+    return {
+        stage: StageResult(
+            median(run[stage].time_taken for run in runs),
+            int(median(run[stage].peak_rss for run in runs)),
+        )
+        for stage in STAGES
+    }
+
+
+def get_machine() -> Dict:
+    return {"platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def load_baseline(baseline_path: str) -> Optional[Dict]:
+    try:
+        with open(baseline_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as error:
+        exit_program(f"Unable to load the baseline: {error}")
+
+
+def save_baseline(
+    baseline_path: str, results: Dict[str, Dict[str, StageResult]]
+) -> None:
+    partial_path = f"{baseline_path}.partial"
+
+    with open(partial_path, "w") as f:
+        json.dump(
+            {
+                "machine": get_machine(),
+                "cases": {
+                    case_name: {
+                        stage: asdict(stage_result)
+                        for stage, stage_result in stage_results.items()
+                    }
+                    for case_name, stage_results in results.items()
+                },
+            },
+            f,
+            indent=4,
+        )
+
+    os.replace(partial_path, baseline_path)
+
+
+def format_change(value: float, baseline_value: float) -> str:
+    if not baseline_value:
+        return "N/A"
+
+    return f"{(value / baseline_value - 1) * 100:+.1f}%"
+
+
+def compare_with_baseline(
+    results: Dict[str, Dict[str, StageResult]],
+    baseline: Dict,
+    time_threshold: float,
+    memory_threshold: float,
+) -> Tuple[PrettyTable, List[str]]:
+    """
+    A table of each stage's results and their change from the baseline, and a description of each regression.
+    A stage has regressed if it is more than time_threshold slower (as a fraction of the baseline) or uses more than
+    memory_threshold more memory. Cases and stages that are not in the baseline are never regressions.
+    """
+    table = PrettyTable()
+    table.field_names = [
+        "Case",
+        "Stage",
+        "Time (s)",
+        "Baseline (s)",
+        "Time Change",
+        "Peak RSS Rise (MB)",
+        "Baseline (MB)",
+        "Memory Change",
+    ]
+    regressions = []
+
+    for case_name, stage_results in results.items():
+        baseline_stages = baseline["cases"].get(case_name, {})
+
+        for stage, stage_result in stage_results.items():
+            baseline_result = baseline_stages.get(stage)
+
+            if baseline_result is None:
+                table.add_row(
+                    [
+                        case_name,
+                        stage,
+                        force_decimal_places(stage_result.time_taken, 3),
+                        "N/A",
+                        "N/A",
+                        force_decimal_places(stage_result.peak_rss / 1_000_000, 1),
+                        "N/A",
+                        "N/A",
+                    ]
+                )
+                continue
+
+            baseline_result = StageResult(**baseline_result)
+            table.add_row(
+                [
+                    case_name,
+                    stage,
+                    force_decimal_places(stage_result.time_taken, 3),
+                    force_decimal_places(baseline_result.time_taken, 3),
+                    format_change(stage_result.time_taken, baseline_result.time_taken),
+                    force_decimal_places(stage_result.peak_rss / 1_000_000, 1),
+                    force_decimal_places(baseline_result.peak_rss / 1_000_000, 1),
+                    format_change(stage_result.peak_rss, baseline_result.peak_rss),
+                ]
+            )
+
+            if (
+                stage_result.time_taken
+                > baseline_result.time_taken * (1 + time_threshold)
+                and stage_result.time_taken - baseline_result.time_taken
+                >= MIN_TIME_INCREASE
+            ):
+                regressions.append(
+                    f"{case_name} {stage}: {format_change(stage_result.time_taken, baseline_result.time_taken)} time"
+                )
+
+            if (
+                stage_result.peak_rss
+                > baseline_result.peak_rss * (1 + memory_threshold)
+                and stage_result.peak_rss - baseline_result.peak_rss
+                >= MIN_MEMORY_INCREASE
+            ):
+                regressions.append(
+                    f"{case_name} {stage}: {format_change(stage_result.peak_rss, baseline_result.peak_rss)} peak RSS"
+                )
+
+    return table, regressions
+
+
+def main():
+    benchmark_parser = argparse.ArgumentParser(
+        description="Measure the time taken and the peak memory used by each stage of VQM's pipeline "
+        "on videos generated by FFmpeg, and compare them with a baseline."
+    )
+    benchmark_parser.add_argument(
+        "--baseline",
+        default="benchmark_baseline.json",
+        help="The JSON file to compare with. It is created if it does not exist. Default: benchmark_baseline.json",
+    )
+    benchmark_parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Replace the baseline with the results of this run instead of comparing with it.",
+    )
+    benchmark_parser.add_argument(
+        "--output-folder",
+        default="benchmark_output",
+        help="Where the generated videos and the output of each stage are saved. Default: benchmark_output",
+    )
+    benchmark_parser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=[case.name for case in CASES],
+        default=[case.name for case in CASES],
+        metavar="<case>",
+        help=f"The cases to run. Default: all of them ({', '.join(case.name for case in CASES)})",
+    )
+    benchmark_parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Run each case this many times and use the median of each measurement. Default: 3",
+    )
+    benchmark_parser.add_argument(
+        "--time-threshold",
+        type=float,
+        default=0.2,
+        help="Fail if a stage takes more than this fraction longer than the baseline. Default: 0.2",
+    )
+    benchmark_parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=0.2,
+        help="Fail if the peak memory of a stage rises by more than this fraction more than in the baseline. Default: 0.2",
+    )
+    benchmark_args = benchmark_parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        exit_program("The benchmark can only be run on Linux or macOS.")
+
+    if benchmark_args.repeats < 1:
+        exit_program(
+            f"--repeats must be at least 1, but {benchmark_args.repeats} was specified"
+        )
+
+    baseline = (
+        None
+        if benchmark_args.update_baseline
+        else load_baseline(benchmark_args.baseline)
+    )
+    results = {
+        case.name: benchmark_case(
+            case, benchmark_args.output_folder, benchmark_args.repeats
+        )
+        for case in CASES
+        if case.name in benchmark_args.cases
+    }
+
+    line()
+
+    if baseline is None:
+        save_baseline(benchmark_args.baseline, results)
+        log.info(f"The results were saved as the baseline: {benchmark_args.baseline}")
+        return
+
+    if baseline.get("machine") != get_machine():
+        log.info(
+            f"Warning: the baseline was measured on a different machine ({baseline.get('machine')}), "
+            "so the results may not be comparable."
+        )
+
+    table, regressions = compare_with_baseline(
+        results,
+        baseline,
+        benchmark_args.time_threshold,
+        benchmark_args.memory_threshold,
+    )
+    log.info(table.get_string())
+    line()
+
+    if regressions:
+        log.info("These stages regressed past the thresholds:")
+        for regression in regressions:
+            log.info(regression)
+        sys.exit(1)
+
+    log.info("No stage regressed past the thresholds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 from utils import Logger
 
 log = Logger("factory")
@@ -11,6 +11,7 @@ class EncoderOptions:
     encoder: str
     options: Optional[str] = None
     av1_cpu_used: Optional[str] = None
+    threads: Optional[int] = None
 
 
 @dataclass
@@ -21,25 +22,43 @@ class EncodingArguments:
     parameter: Optional[str] = None
     value: Optional[str] = None
     combination: Optional[List[str]] = None
+    # Needed when the output is a pipe, as FFmpeg cannot infer the format from the extension.
+    output_format: Optional[str] = None
+    # Only encode the video stream of this range of the original video, in seconds.
+    # The range starts at the keyframe at or before start_time, without decoding any frame before it,
+    # and the duration is measured from that keyframe.
+    start_time: Optional[float] = None
+    duration: Optional[float] = None
 
     def __post_init__(self) -> None:
         self.original_video_path = Path(self.original_video_path)
         self.output_path = Path(self.output_path)
 
-        self._base_ffmpeg_arguments = [
-            "ffmpeg",
-            "-y",
-            "-i",
-            str(self.original_video_path),
-            "-map",
-            "0",
-            "-c:a",
-            "copy",
-            "-c:s",
-            "copy",
-            "-c:v",
-            self.encoder_options.encoder,
-        ]
+        self._base_ffmpeg_arguments = ["ffmpeg", "-y"]
+
+        if self.start_time is not None:
+            self._base_ffmpeg_arguments.extend(
+                ["-noaccurate_seek", "-ss", f"{self.start_time:.6f}"]
+            )
+
+        if self.duration is not None:
+            self._base_ffmpeg_arguments.extend(["-t", f"{self.duration:.6f}"])
+
+        self._base_ffmpeg_arguments.extend(["-i", str(self.original_video_path)])
+
+        if self.start_time is None and self.duration is None:
+            self._base_ffmpeg_arguments.extend(
+                ["-map", "0", "-c:a", "copy", "-c:s", "copy"]
+            )
+        else:
+            self._base_ffmpeg_arguments.extend(["-map", "0:V"])
+
+        self._base_ffmpeg_arguments.extend(["-c:v", self.encoder_options.encoder])
+
+        if self.encoder_options.threads is not None:
+            self._base_ffmpeg_arguments.extend(
+                ["-threads", str(self.encoder_options.threads)]
+            )
 
         if self.encoder_options.options is not None:
             self._base_ffmpeg_arguments.extend(self.encoder_options.options.split())
@@ -58,21 +77,23 @@ class EncodingArguments:
                 "0",
                 "-cpu-used",
                 self.encoder_options.av1_cpu_used,
-                str(self.output_path),
             ]
         elif self.combination:
-            self.combination.append(str(self.output_path))
-            encoding_arguments = self.combination
+            encoding_arguments = list(self.combination)
         elif self.parameter and self.value:
             encoding_arguments = [
                 f"-{self.parameter}",
                 self.value,
-                str(self.output_path),
             ]
         else:
             raise ValueError("Invalid encoding configuration")
 
-        return self._base_ffmpeg_arguments + encoding_arguments
+        if self.output_format is not None:
+            encoding_arguments.extend(["-f", self.output_format])
+
+        return (
+            self._base_ffmpeg_arguments + encoding_arguments + [str(self.output_path)]
+        )
 
 
 @dataclass
@@ -81,6 +102,9 @@ class LibVmafArguments:
     distorted_video: Union[str, Path]
     vmaf_options: str
     video_filters: Optional[str] = None
+    # The range of both videos to score, in seconds.
+    start_time: Optional[float] = None
+    duration: Optional[float] = None
 
     def __post_init__(self) -> None:
         self.original_video = Path(self.original_video)
@@ -88,22 +112,34 @@ class LibVmafArguments:
         self._video_filters = (
             f"{self.video_filters}," if self.video_filters is not None else ""
         )
+        self._timestamps = (
+            "setpts=PTS-STARTPTS" if self.start_time is None else "settb=1/24,setpts=N"
+        )
+
+    def _get_input_options(self) -> List[str]:
+        if self.start_time is None:
+            return ["-r", "24"]
+
+        # -r would replace the timestamps that -ss seeks by, so the frames are given 24 FPS timestamps after seeking instead.
+        options = ["-ss", f"{self.start_time:.6f}"]
+        if self.duration is not None:
+            options.extend(["-t", f"{self.duration:.6f}"])
+
+        return options
 
     def get_arguments(self) -> List[str]:
         filtergraph = (
-            f"[0:V]{self._video_filters}setpts=PTS-STARTPTS[reference];"
-            f"[1:V]setpts=PTS-STARTPTS[distorted];"
+            f"[0:V]{self._video_filters}{self._timestamps}[reference];"
+            f"[1:V]{self._timestamps}[distorted];"
             f"[distorted][reference]libvmaf={self.vmaf_options}"
         )
 
         return [
             "ffmpeg",
-            "-r",
-            "24",
+            *self._get_input_options(),
             "-i",
             str(self.original_video),
-            "-r",
-            "24",
+            *self._get_input_options(),
             "-i",
             str(self.distorted_video),
             "-map",
@@ -116,3 +152,110 @@ class LibVmafArguments:
             "null",
             "-",
         ]
+
+
+@dataclass
+class SegmentsLibVmafArguments:
+    """
+    Score several ranges of both videos as if they were one video. Each range is seeked to,
+    so only the frames from the keyframe before each range are decoded, rather than the whole of both videos.
+    """
+
+    original_video: Union[str, Path]
+    distorted_video: Union[str, Path]
+    vmaf_options: str
+    # The start time (in seconds) and the number of frames of each range.
+    segments: List[Tuple[float, int]]
+    framerate: float
+    video_filters: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        self.original_video = Path(self.original_video)
+        self.distorted_video = Path(self.distorted_video)
+        self._video_filters = (
+            f"{self.video_filters}," if self.video_filters is not None else ""
+        )
+
+    def get_arguments(self) -> List[str]:
+        arguments = ["ffmpeg"]
+
+        filtergraph = []
+
+        # The inputs alternate between the original and distorted videos.
+        # -t is not frame-accurate for every container, so it only limits how much is read, and trim cuts each range.
+        for i, (start_time, num_frames) in enumerate(self.segments):
+            for j, video in enumerate((self.original_video, self.distorted_video)):
+                arguments.extend(
+                    [
+                        "-ss",
+                        f"{start_time:.6f}",
+                        "-t",
+                        f"{(num_frames + 1) / self.framerate:.6f}",
+                        "-i",
+                        str(video),
+                    ]
+                )
+                filtergraph.append(
+                    f"[{2 * i + j}:V]trim=end_frame={num_frames}[segment{i}_{j}]"
+                )
+
+        num_segments = len(self.segments)
+        reference_segments = "".join(f"[segment{i}_0]" for i in range(num_segments))
+        distorted_segments = "".join(f"[segment{i}_1]" for i in range(num_segments))
+
+        filtergraph.extend(
+            [
+                f"{reference_segments}concat=n={num_segments}:v=1:a=0,"
+                f"{self._video_filters}settb=1/24,setpts=N[reference]",
+                f"{distorted_segments}concat=n={num_segments}:v=1:a=0,settb=1/24,setpts=N[distorted]",
+                f"[distorted][reference]libvmaf={self.vmaf_options}",
+            ]
+        )
+
+        return arguments + ["-lavfi", ";".join(filtergraph), "-f", "null", "-"]
+
+
+@dataclass
+class MultiLibVmafArguments:
+    """Score several distorted videos against a single decode of the original video."""
+
+    original_video: Union[str, Path]
+    distorted_videos: List[Union[str, Path]]
+    vmaf_options: List[str]
+    video_filters: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        if len(self.distorted_videos) != len(self.vmaf_options):
+            raise ValueError("Each distorted video must have its own libvmaf options")
+
+        self.original_video = Path(self.original_video)
+        self.distorted_videos = [Path(video) for video in self.distorted_videos]
+        self._video_filters = (
+            f"{self.video_filters}," if self.video_filters is not None else ""
+        )
+
+    def get_arguments(self) -> List[str]:
+        num_distorted = len(self.distorted_videos)
+        reference_labels = "".join(f"[reference{i}]" for i in range(num_distorted))
+
+        filtergraph = [
+            f"[0:V]{self._video_filters}setpts=PTS-STARTPTS,split={num_distorted}{reference_labels}"
+        ]
+
+        for i, vmaf_options in enumerate(self.vmaf_options):
+            filtergraph.append(f"[{i + 1}:V]setpts=PTS-STARTPTS[distorted{i}]")
+            filtergraph.append(
+                f"[distorted{i}][reference{i}]libvmaf={vmaf_options}[vmaf{i}]"
+            )
+
+        arguments = ["ffmpeg", "-r", "24", "-i", str(self.original_video)]
+
+        for distorted_video in self.distorted_videos:
+            arguments.extend(["-r", "24", "-i", str(distorted_video)])
+
+        arguments.extend(["-lavfi", ";".join(filtergraph)])
+
+        for i in range(num_distorted):
+            arguments.extend(["-map", f"[vmaf{i}]", "-f", "null", "-"])
+
+        return arguments
@@ -0,0 +1,52 @@
+import json
+import os
+from typing import List, Optional
+
+from metrics import FRAME_COLUMNS_FOLDER, FrameData, METRIC_KEYS
+from sweep import SweepJob, SweepResult
+
+INDEX_FILENAME = "frame_store_index.json"
+
+
+class FrameStore:
+    """
+    An index of the per-frame scores of every value in a sweep.
+    The scores of each value are stored as one .npy file per column in the value's output folder,
+    so they can be memory-mapped for later analysis instead of parsing the libvmaf logs again.
+    """
+
+    def __init__(self, output_folder: str, jobs: Optional[List[SweepJob]] = None):
+        self._output_folder = output_folder
+        self._path = os.path.join(output_folder, INDEX_FILENAME)
+        self._folders = {
+            job.label: os.path.relpath(
+                os.path.join(job.output_folder, FRAME_COLUMNS_FOLDER), output_folder
+            )
+            for job in jobs or []
+        }
+        self._entries = {}
+
+    def record(self, result: SweepResult) -> None:
+        folder = self._folders[result.label]
+        # Only the metrics of this run, as the folder may contain the columns of a previous run with other metrics.
+        frame_data = FrameData.load(
+            os.path.join(self._output_folder, folder),
+            [METRIC_KEYS[metric_type] for metric_type in result.metric_scores],
+        )
+
+        self._entries[result.label] = {
+            "folder": folder,
+            "frames": len(frame_data),
+            "columns": frame_data.metric_keys,
+        }
+
+        partial_path = f"{self._path}.partial"
+        with open(partial_path, "w") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(partial_path, self._path)
+
+    def load(self, label: str) -> FrameData:
+        entry = self._entries[label]
+        return FrameData.load(
+            os.path.join(self._output_folder, entry["folder"]), entry["columns"]
+        )
@@ -0,0 +1,336 @@
+import argparse
+from dataclasses import asdict, replace
+import json
+import os
+import socket
+import sqlite3
+from threading import Event, Thread
+import time
+import traceback
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from reference_cache import ReferenceVideo
+from result_cache import ResultCache
+from scheduler import run_jobs
+from sweep import run_job, SweepJob, SweepResult
+from utils import exit_program, line, Logger
+
+log = Logger("job_queue")
+
+# A job is not retried once it has been attempted this many times, including attempts whose worker stopped responding.
+MAX_ATTEMPTS = 3
+# How often the coordinator and idle workers check the queue, in seconds.
+POLL_INTERVAL = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sweep TEXT NOT NULL,
+    label TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT
+)
+"""
+
+
+def connect(queue_path: str) -> sqlite3.Connection:
+    # Autocommit mode, so that claiming a job can use an explicit BEGIN IMMEDIATE transaction.
+    connection = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    connection.execute(SCHEMA)
+    return connection
+
+
+def fail_expired_jobs(connection: sqlite3.Connection) -> None:
+    """Fail the jobs whose worker stopped renewing the lease on the last attempt."""
+    connection.execute(
+        "UPDATE jobs SET state = 'failed', error = 'The worker stopped renewing the lease.' "
+        "WHERE state = 'running' AND lease_expires < ? AND attempts >= ?",
+        (time.time(), MAX_ATTEMPTS),
+    )
+
+
+def get_absolute_path(path: str) -> str:
+    return os.path.abspath(path) if os.path.exists(path) else path
+
+
+def enqueue_jobs(
+    connection: sqlite3.Connection,
+    sweep: str,
+    jobs: List[SweepJob],
+    video_path: str,
+    reference: ReferenceVideo,
+    args,
+) -> List[int]:
+    """
+    Add the jobs to the queue, replacing any jobs left by a previous run of the same sweep.
+    Paths are made absolute, as the workers may run in a different directory.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    connection.execute("DELETE FROM jobs WHERE sweep = ?", (sweep,))
+
+    job_ids = []
+    for job in jobs:
+        payload = {
+            "job": asdict(
+                replace(
+                    job,
+                    output_folder=os.path.abspath(job.output_folder),
+                    output_path=os.path.abspath(job.output_path),
+                )
+            ),
+            "video_path": get_absolute_path(video_path),
+            "reference": asdict(
+                replace(reference, path=get_absolute_path(reference.path))
+            ),
+            "args": vars(args),
+        }
+
+        cursor = connection.execute(
+            "INSERT INTO jobs (sweep, label, payload) VALUES (?, ?, ?)",
+            (sweep, job.label, json.dumps(payload)),
+        )
+        job_ids.append(cursor.lastrowid)
+
+    connection.execute("COMMIT")
+    return job_ids
+
+
+def run_queued_jobs(
+    jobs: List[SweepJob], video_path: str, reference: ReferenceVideo, args
+) -> Iterator[SweepResult]:
+    """
+    Add the jobs to the queue at args.queue and yield their results, in the order that the jobs were specified,
+    as the workers complete them.
+    """
+    connection = connect(args.queue)
+    # Every job's output folder is inside the sweep's output folder, which identifies the sweep.
+    sweep = os.path.dirname(os.path.abspath(jobs[0].output_folder))
+    job_ids = enqueue_jobs(connection, sweep, jobs, video_path, reference, args)
+
+    log.info(
+        f"{len(jobs)} job(s) were added to the queue. Start the workers with:\n"
+        f"python main.py worker --queue {os.path.abspath(args.queue)}"
+    )
+
+    last_counts = None
+
+    for job_id, job in zip(job_ids, jobs):
+        while True:
+            fail_expired_jobs(connection)
+            state, attempts, result, error = connection.execute(
+                "SELECT state, attempts, result, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+
+            if state == "done":
+                yield SweepResult.from_dict(json.loads(result))
+                break
+
+            if state == "failed":
+                exit_program(
+                    f"The job for {job.description} failed after {attempts} attempt(s):\n{error}"
+                )
+
+            counts = connection.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE sweep = ? GROUP BY state ORDER BY state",
+                (sweep,),
+            ).fetchall()
+
+            if counts != last_counts:
+                log.info(
+                    f"Queue: {', '.join(f'{count} {state}' for state, count in counts)}"
+                )
+                last_counts = counts
+
+            time.sleep(POLL_INTERVAL)
+
+    connection.close()
+
+
+def run_jobs_on_workers(
+    jobs: List[SweepJob],
+    video_path: str,
+    reference: ReferenceVideo,
+    args,
+    result_cache: Optional[ResultCache] = None,
+    completed_results: Optional[Dict[str, SweepResult]] = None,
+) -> Iterator[SweepResult]:
+    """The same as scheduler.run_jobs, but the jobs without a result are run by worker processes."""
+    return run_jobs(
+        jobs,
+        video_path,
+        reference,
+        args,
+        result_cache,
+        completed_results,
+        run_uncached=run_queued_jobs,
+    )
+
+
+def claim_job(
+    connection: sqlite3.Connection, worker_id: str, lease: float
+) -> Optional[Tuple[int, Dict]]:
+    """Claim the oldest job that is pending or whose lease has expired, or return None if there is no such job."""
+    connection.execute("BEGIN IMMEDIATE")
+
+    try:
+        fail_expired_jobs(connection)
+        row = connection.execute(
+            "SELECT id, payload FROM jobs "
+            "WHERE state = 'pending' OR (state = 'running' AND lease_expires < ?) "
+            "ORDER BY id LIMIT 1",
+            (time.time(),),
+        ).fetchone()
+
+        if row is not None:
+            connection.execute(
+                "UPDATE jobs SET state = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (worker_id, time.time() + lease, row[0]),
+            )
+
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+    if row is None:
+        return None
+
+    return row[0], json.loads(row[1])
+
+
+def renew_lease(
+    queue_path: str, job_id: int, worker_id: str, lease: float, stop: Event
+) -> None:
+    # SQLite connections cannot be shared between threads.
+    connection = connect(queue_path)
+
+    while not stop.wait(lease / 3):
+        connection.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'running'",
+            (time.time() + lease, job_id, worker_id),
+        )
+
+    connection.close()
+
+
+def run_claimed_job(
+    connection: sqlite3.Connection,
+    queue_path: str,
+    job_id: int,
+    payload: Dict,
+    worker_id: str,
+    lease: float,
+) -> None:
+    job = SweepJob(**payload["job"])
+    stop_renewing = Event()
+    renewer = Thread(
+        target=renew_lease,
+        args=(queue_path, job_id, worker_id, lease, stop_renewing),
+        daemon=True,
+    )
+    renewer.start()
+
+    try:
+        result = run_job(
+            job,
+            payload["video_path"],
+            ReferenceVideo(**payload["reference"]),
+            argparse.Namespace(**payload["args"]),
+        )
+    except (Exception, SystemExit):
+        error = traceback.format_exc()
+        log.info(f"The job for {job.description} failed:\n{error}")
+
+        # The job is only updated if this worker still holds the lease.
+        connection.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, worker = NULL, lease_expires = NULL "
+            "WHERE id = ? AND worker = ? AND state = 'running'",
+            (MAX_ATTEMPTS, error, job_id, worker_id),
+        )
+        return
+    except KeyboardInterrupt:
+        # Release the job so that another worker can run it straight away.
+        connection.execute(
+            "UPDATE jobs SET state = 'pending', worker = NULL, lease_expires = NULL "
+            "WHERE id = ? AND worker = ? AND state = 'running'",
+            (job_id, worker_id),
+        )
+        raise
+    finally:
+        stop_renewing.set()
+        renewer.join()
+
+    connection.execute(
+        "UPDATE jobs SET state = 'done', result = ?, error = NULL, lease_expires = NULL "
+        "WHERE id = ? AND worker = ? AND state = 'running'",
+        (json.dumps(result.to_dict()), job_id, worker_id),
+    )
+
+
+def run_worker(argv: List[str]) -> None:
+    """Claim and run jobs from the queue until it is empty (with --exit-when-empty) or the worker is stopped."""
+    worker_parser = argparse.ArgumentParser(
+        prog="main.py worker",
+        description="Run the jobs that were added to a queue with --queue.",
+    )
+    worker_parser.add_argument(
+        "--queue", required=True, help="The path of the queue's SQLite database."
+    )
+    worker_parser.add_argument(
+        "--lease",
+        type=float,
+        default=60,
+        help="If the worker does not renew its claim on a job for this many seconds, e.g. because its machine stopped,\n"
+        "another worker can claim the job. Default: 60",
+    )
+    worker_parser.add_argument(
+        "--exit-when-empty",
+        action="store_true",
+        help="Exit when there are no pending or running jobs, instead of waiting for more jobs.",
+    )
+    worker_args = worker_parser.parse_args(argv)
+
+    connection = connect(worker_args.queue)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    line()
+    log.info(f"Worker {worker_id} is waiting for jobs in {worker_args.queue}")
+
+    while True:
+        claimed = claim_job(connection, worker_id, worker_args.lease)
+
+        if claimed is None:
+            (unfinished,) = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'running')"
+            ).fetchone()
+
+            if worker_args.exit_when_empty and unfinished == 0:
+                break
+
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        job_id, payload = claimed
+        line()
+        log.info(
+            f"Worker {worker_id} claimed '{payload['job']['label']}' (job {job_id})."
+        )
+        run_claimed_job(
+            connection,
+            worker_args.queue,
+            job_id,
+            payload,
+            worker_id,
+            worker_args.lease,
+        )
+
+    connection.close()
+    log.info(f"Worker {worker_id} has finished, as the queue is empty.")
@@ -1,27 +1,50 @@
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from copy import copy
 import os
+from pathlib import Path
+import subprocess
+from typing import Optional, Tuple
 
-from ffmpeg_process_factory import LibVmafArguments
-from utils import line, Logger, get_metrics_list, Timer
+import numpy as np
 
-from better_ffmpeg_progress import FfmpegProcess
+from ffmpeg_process_factory import LibVmafArguments, MultiLibVmafArguments
+from metrics import FrameData, load_frame_data, METRIC_KEYS, write_frame_log
+from utils import (
+    combine_resource_usage,
+    exit_program,
+    force_decimal_places,
+    get_metrics_list,
+    line,
+    Logger,
+    ResourceUsage,
+    run_ffmpeg,
+    run_process,
+    Timer,
+    VideoInfoProvider,
+)
 
 log = Logger("libvmaf.py")
 
-# Change this if you want to use a different VMAF model file.
+# Change this if you want to use a different VMAF model file. A relative path is relative to this file's folder.
 model_file_path = "vmaf_models/vmaf_v0.6.1.json"
 
 
-def run_libvmaf(
-    transcode_output_path,
-    args,
-    json_file_path,
-    original_video_path,
-    message="",
-):
+def get_model_file_path() -> str:
+    """
+    The absolute path of the VMAF model file, so that it is found whatever the working directory is,
+    e.g. when a worker was started in another folder.
+    """
+    model_path = (Path(__file__).parent / model_file_path).resolve()
+    # The path is unescaped by the filtergraph, then by the filter's options and then by libvmaf's model option,
+    # so a colon (e.g. in a Windows drive letter) is escaped once for each of them.
+    return model_path.as_posix().replace(":", r"\\\\\\\:")
+
+
+def get_vmaf_options(args, log_file_path) -> str:
     n_subsample = args.n_subsample if args.n_subsample else "1"
 
     model_params = [
-        f"path={model_file_path}",
+        f"path={get_model_file_path()}",
     ]
 
     if args.phone_model:
@@ -29,39 +52,222 @@ def run_libvmaf(
 
     model_string = f"model={'|'.join(model_params)}"
 
-    json_file_path_str = str(json_file_path).replace("\\", "/")
+    log_file_path_str = str(log_file_path).replace("\\", "/")
     # Escape any single quotes
-    json_file_path_escaped = json_file_path_str.replace("'", "\\'")
+    log_file_path_escaped = log_file_path_str.replace("'", "\\'")
 
     features = [
         "name=psnr" if not args.disable_psnr else None,
         "name=float_ssim" if not args.disable_ssim else None,
     ]
-    feature_string = f":feature={'|'.join(features)}"
+    features = list(filter(None, features))
+    feature_string = f":feature={'|'.join(features)}" if features else ""
 
     # On Windows, escape the pipe character
     if os.name == "nt":
         feature_string = feature_string.replace("|", "^|")
 
-    vmaf_options = f"{model_string}:log_fmt=json:log_path='{json_file_path_escaped}':n_subsample={n_subsample}:n_threads={args.n_threads}{feature_string}"
+    return f"{model_string}:log_fmt={args.log_format}:log_path='{log_file_path_escaped}':n_subsample={n_subsample}:n_threads={args.n_threads}{feature_string}"
+
+
+def get_metric_types(args) -> str:
+    metrics_list = get_metrics_list(args)
+
+    metric_types = metrics_list[0]
+    if len(metrics_list) > 1:
+        metric_types = f"{', '.join(metrics_list[:-1])} and {metrics_list[-1]}"
+
+    return metric_types
+
+
+def run_libvmaf(
+    transcode_output_path,
+    args,
+    log_file_path,
+    reference,
+    message="",
+):
+    if args.vmaf_chunks > 1:
+        return run_libvmaf_chunked(
+            transcode_output_path, args, log_file_path, reference, message
+        )
+
+    vmaf_options = get_vmaf_options(args, log_file_path)
 
     libvmaf_arguments = LibVmafArguments(
-        original_video_path, transcode_output_path, vmaf_options, args.video_filters
+        reference.path, transcode_output_path, vmaf_options, reference.video_filters
     )
 
-    process = FfmpegProcess(
+    line()
+    log.info(f"Calculating the {get_metric_types(args)}{message}...\n")
+
+    timer = Timer()
+    timer.start()
+    resource_usage = run_ffmpeg(
         libvmaf_arguments.get_arguments(),
-        print_detected_duration=False,
+        Path(log_file_path).parent / "libvmaf_ffmpeg_log.txt",
+        args,
     )
+    log.info(f"Time Taken: {timer.stop(args.decimal_places)}s")
 
-    metrics_list = get_metrics_list(args)
+    return resource_usage
 
-    metric_types = metrics_list[0]
-    if len(metrics_list) > 1:
-        metric_types = f"{', '.join(metrics_list[:-1])} and {metrics_list[-1]}"
+
+def get_chunk_log_file_path(log_file_path, chunk_number) -> Path:
+    log_file_path = Path(log_file_path)
+    return log_file_path.with_name(
+        f"{log_file_path.stem}_chunk{chunk_number}{log_file_path.suffix}"
+    )
+
+
+def run_libvmaf_chunked(
+    transcode_output_path,
+    args,
+    log_file_path,
+    reference,
+    message="",
+):
+    """
+    Split the videos into args.vmaf_chunks ranges of frames and score the ranges in parallel FFmpeg processes.
+    Each range is scored with one extra frame on either side, which is then discarded, as VMAF's motion feature
+    compares each frame with its neighbours. The ranges' logs are merged into log_file_path, renumbered so that
+    the result is identical to scoring the whole video in one process. The FFmpeg log of each range is written
+    next to libvmaf_ffmpeg_log.txt, with the number of the range appended.
+    """
+    video_info = VideoInfoProvider(reference.path)
+    framerate = video_info.get_framerate_float()
+    num_frames = round(video_info.get_duration() * framerate)
+    num_chunks = min(args.vmaf_chunks, max(1, num_frames))
+    boundaries = [round(i * num_frames / num_chunks) for i in range(num_chunks + 1)]
+
+    chunk_args = copy(args)
+    chunk_args.n_threads = str(max(1, int(args.n_threads) // num_chunks))
+    metric_keys = [METRIC_KEYS[metric_type] for metric_type in get_metrics_list(args)]
+    ffmpeg_log_file_path = Path(log_file_path).parent / "libvmaf_ffmpeg_log.txt"
+
+    def score_chunk(chunk_number: int) -> Tuple[FrameData, Optional[ResourceUsage]]:
+        start, end = boundaries[chunk_number], boundaries[chunk_number + 1]
+        is_last_chunk = chunk_number == num_chunks - 1
+        first_frame = max(0, start - 1)
+        chunk_log_file_path = get_chunk_log_file_path(log_file_path, chunk_number)
+
+        # Seek half a frame before the first frame, so that rounding never includes the frame before it.
+        # The last chunk is scored until the end of the videos, in case the number of frames was estimated incorrectly.
+        libvmaf_arguments = LibVmafArguments(
+            reference.path,
+            transcode_output_path,
+            get_vmaf_options(chunk_args, chunk_log_file_path),
+            reference.video_filters,
+            start_time=max(0, (first_frame - 0.5) / framerate),
+            duration=None if is_last_chunk else (end + 1 - first_frame) / framerate,
+        )
+
+        chunk_ffmpeg_log_file_path = get_chunk_log_file_path(
+            ffmpeg_log_file_path, chunk_number
+        )
+        try:
+            resource_usage = run_process(
+                libvmaf_arguments.get_arguments(), chunk_ffmpeg_log_file_path
+            )
+        except subprocess.CalledProcessError:
+            exit_program(
+                f"FFmpeg failed to score frames {start}-{end - 1} of {transcode_output_path}. "
+                f"Check '{chunk_ffmpeg_log_file_path}' for details."
+            )
+
+        chunk_data = load_frame_data(str(chunk_log_file_path), metric_keys)
+        os.remove(chunk_log_file_path)
+
+        # Renumber the frames and discard the extra frames either side of the range.
+        frame_numbers = chunk_data.frame_numbers + first_frame
+        in_range = (frame_numbers >= start) & ((frame_numbers < end) | is_last_chunk)
+
+        if not is_last_chunk and np.count_nonzero(in_range) != end - start:
+            exit_program(
+                f"Expected {end - start} frames from frame {start} of {transcode_output_path}, "
+                f"but libvmaf scored {np.count_nonzero(in_range)}. Is the frame rate constant?"
+            )
+
+        return (
+            FrameData.from_arrays(
+                frame_numbers[in_range],
+                {key: chunk_data.get_scores(key)[in_range] for key in metric_keys},
+            ),
+            resource_usage,
+        )
 
     line()
-    log.info(f"Calculating the {metric_types}{message}...\n")
+    log.info(
+        f"Calculating the {get_metric_types(args)}{message} "
+        f"in {num_chunks} chunks of ~{num_frames // num_chunks} frames, in parallel...\n"
+    )
+
+    timer = Timer()
+    timer.start()
+
+    with ThreadPoolExecutor(max_workers=num_chunks) as executor:
+        futures = {
+            executor.submit(score_chunk, chunk_number): chunk_number
+            for chunk_number in range(num_chunks)
+        }
+        results = [None] * num_chunks
+
+        # An error raised by a chunk, including exit_program's SystemExit, is raised again by result().
+        for completed, future in enumerate(as_completed(futures), 1):
+            chunk_number = futures[future]
+            results[chunk_number] = future.result()
+            log.info(
+                f"Scored frames {boundaries[chunk_number]}-{boundaries[chunk_number + 1] - 1} "
+                f"({completed}/{num_chunks} chunks)"
+            )
+
+    chunks, chunk_usages = zip(*results)
+
+    write_frame_log(
+        FrameData.from_arrays(
+            np.concatenate([chunk.frame_numbers for chunk in chunks]),
+            {
+                key: np.concatenate([chunk.get_scores(key) for chunk in chunks])
+                for key in metric_keys
+            },
+        ),
+        str(log_file_path),
+    )
+
+    time_taken = timer.elapsed()
+    log.info(f"Time Taken: {force_decimal_places(time_taken, args.decimal_places)}s")
+
+    return combine_resource_usage(list(chunk_usages), time_taken, concurrent=True)
+
+
+def run_libvmaf_batch(
+    transcode_output_paths,
+    args,
+    log_file_paths,
+    reference,
+):
+    """Calculate the metrics of every transcode in one FFmpeg process, decoding the reference only once."""
+    libvmaf_arguments = MultiLibVmafArguments(
+        reference.path,
+        transcode_output_paths,
+        [get_vmaf_options(args, log_file_path) for log_file_path in log_file_paths],
+        reference.video_filters,
+    )
+
+    # Not imported at startup, as it is slow to import (see run_ffmpeg).
+    from better_ffmpeg_progress import FfmpegProcess
+
+    process = FfmpegProcess(
+        libvmaf_arguments.get_arguments(),
+        ffmpeg_log_file=Path(log_file_paths[0]).parent.parent
+        / "libvmaf_batch_ffmpeg_log.txt",
+        print_detected_duration=False,
+    )
+
+    line()
+    log.info(
+        f"Calculating the {get_metric_types(args)} of {len(transcode_output_paths)} transcodes in a single pass...\n"
+    )
 
     timer = Timer()
     timer.start()
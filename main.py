@@ -7,19 +7,28 @@ from typing import List, Optional, Tuple
 import numpy as np
 from prettytable import PrettyTable
 
+from analysis import compare_sweeps, load_results, mark_pareto_frontier
 from args import parser
 from arguments_validator import ArgumentsValidator
-from transcode_video import transcode_video
-from libvmaf import run_libvmaf
-from metrics import process_metrics
+from frame_store import FrameStore
+from job_queue import run_jobs_on_workers, run_worker
+from metrics import add_row_to_table, plot_metric_graphs, write_table_to_file
+from manifest import Manifest
 from overview import create_overview_video
+from reference_cache import prepare_reference
+from result_cache import create_result_cache
+from result_stream import ResultStream
+from scheduler import run_jobs
+from sweep import create_jobs
+from target_search import get_target_result, search_target_vmaf
 from utils import (
     cut_video,
     exit_program,
     force_decimal_places,
+    format_bitrate,
     line,
     Logger,
-    plot_graph,
+    GraphRenderer,
     VideoInfoProvider,
     write_table_info,
     get_metrics_list,
@@ -69,6 +78,13 @@ def initialize_table(args) -> PrettyTable:
         "Size",
         "Bitrate",
     ] + metrics_list
+
+    if args.benchmark_runs is not None:
+        column_names.insert(2, "Encoding FPS")
+
+    if args.resource_usage:
+        column_names += ["Encoder Resource Usage", "libvmaf Resource Usage"]
+
     table.field_names = column_names
     return table
 
@@ -94,7 +110,11 @@ def prepare_video(video_path: str, filename: str, output_folder: str, args) -> s
         log.info("Overview mode activated.")
 
         result, concatenated_video = create_overview_video(
-            video_path, output_folder, args.interval, str(args.clip_length)
+            video_path,
+            output_folder,
+            args.interval,
+            str(args.clip_length),
+            args.stratified_clips,
         )
         if result:
             video_path = concatenated_video
@@ -104,154 +124,14 @@ def prepare_video(video_path: str, filename: str, output_folder: str, args) -> s
     return video_path
 
 
-def transcode_and_analyse(
-    video_path: str,
-    output_path: str,
-    output_folder: str,
-    args,
-    combination_list: Optional[List[str]],
-    description: str,
-    value: Optional[str] = None,
-) -> Tuple[float, str]:
-    time_taken = transcode_video(
-        video_path,
-        args,
-        value,
-        output_path,
-        f"Transcoding the video using {description}",
-        combination_list,
-    )
-
-    json_file_path = Path(output_folder) / "per_frame_metrics.json"
-
-    run_libvmaf(
-        output_path,
-        args,
-        json_file_path,
-        video_path,
-        f" achieved with {description}",
-    )
-
-    return time_taken, json_file_path
-
-
-def process_combination(
-    combination: str,
-    video_path: str,
-    output_folder: str,
-    args,
-    table: PrettyTable,
-    vmaf_scores: List[float],
-) -> float:
-    current_output_folder = os.path.join(output_folder, combination.replace(" ", "_"))
-    os.makedirs(current_output_folder, exist_ok=True)
-
-    output_path = os.path.join(
-        current_output_folder, f"{combination.replace(' ', '_')}.mkv"
-    )
-
-    combination_list = combination.split(" ")
-
-    for i in range(0, len(combination_list), 2):
-        combination_list[i] = f"-{combination_list[i]}"
-
-    combination_string = " ".join(combination_list)
-
-    time_taken, json_file_path = transcode_and_analyse(
-        video_path,
-        output_path,
-        current_output_folder,
-        args,
-        combination_list,
-        f"combination '{combination_string}'",
-    )
-
-    vmaf_score = update_metrics(
-        output_folder,
-        current_output_folder,
-        output_path,
-        json_file_path,
-        time_taken,
-        combination_string,
-        args,
-        table,
-    )
-    vmaf_scores.append(vmaf_score)
-    return vmaf_score
-
-
-def process_parameter_value(
-    value: str,
-    video_path: str,
-    output_folder: str,
-    args,
-    table: PrettyTable,
-    vmaf_scores: List[float],
-) -> float:
-    current_output_folder = os.path.join(output_folder, f"{args.parameter}_{value}")
-    os.makedirs(current_output_folder, exist_ok=True)
-
-    output_path = os.path.join(current_output_folder, f"{value}.mkv")
-
-    time_taken, json_file_path = transcode_and_analyse(
-        video_path,
-        output_path,
-        current_output_folder,
-        args,
-        None,
-        f"'-{args.parameter} {value}'",
-        value,
-    )
-
-    vmaf_score = update_metrics(
-        output_folder,
-        current_output_folder,
-        output_path,
-        json_file_path,
-        time_taken,
-        value,
-        args,
-        table,
-    )
-    vmaf_scores.append(vmaf_score)
-    return vmaf_score
-
-
-def update_metrics(
-    output_folder: str,
-    current_output_folder: str,
-    output_path: str,
-    json_file_path: str,
-    time_taken: float,
-    value: str,
-    args,
-    table: PrettyTable,
-) -> float:
-    provider = VideoInfoProvider(output_path)
-    size = force_decimal_places(
-        os.path.getsize(output_path) / 1_000_000, args.decimal_places
-    )
-    bitrate = provider.get_bitrate(args.decimal_places)
-
-    return process_metrics(
-        os.path.join(output_folder, "metrics_table.txt"),
-        json_file_path,
-        args,
-        args.decimal_places,
-        [f"{size} MB", bitrate],
-        table,
-        current_output_folder,
-        time_taken,
-        value,
-    )
-
-
 def finalise(
     filename: str,
     output_folder: str,
     original_bitrate: str,
     args,
+    values: List[str],
     vmaf_scores: List[float],
+    graph_renderer: Optional[GraphRenderer],
 ) -> None:
     mean_vmaf = force_decimal_places(np.mean(vmaf_scores), args.decimal_places)
 
@@ -263,9 +143,11 @@ def finalise(
     )
 
     parameter = args.parameter if args.parameter else "Combination"
-    values = args.values if args.values else args.combinations.split(",")
 
-    plot_graph(
+    if not graph_renderer:
+        return
+
+    graph_renderer.plot_graph(
         f"{parameter} vs VMAF",
         parameter,
         "VMAF",
@@ -277,6 +159,31 @@ def finalise(
     )
 
 
+def report_target_result(table_path: str, results, args) -> None:
+    target_result = get_target_result(results, args.target_vmaf)
+
+    if target_result is None:
+        message = (
+            f"None of the values that were tried achieved a VMAF of {args.target_vmaf}."
+        )
+    else:
+        message = (
+            f"'-{args.parameter} {target_result.label}' achieves the target VMAF of {args.target_vmaf} "
+            f"(VMAF: {target_result.vmaf_mean}, bitrate: {format_bitrate(target_result.bitrate, args.decimal_places)})."
+        )
+
+    report(table_path, message)
+
+
+def report(table_path: str, message: str) -> None:
+    """Log the message and add it to the end of the table file."""
+    line()
+    log.info(message)
+
+    with open(table_path, "a") as f:
+        f.write(f"\n{message}")
+
+
 def main():
     if len(sys.argv) == 1:
         line()
@@ -286,6 +193,10 @@ def main():
         line()
         return
 
+    if sys.argv[1] == "worker":
+        run_worker(sys.argv[2:])
+        return
+
     args = parser.parse_args()
     validate_args(args)
 
@@ -315,11 +226,11 @@ def main():
 
     if args.combinations:
         log.info("Combination Mode activated.")
-
-        for combination in args.combinations.split(","):
-            process_combination(
-                combination, video_path, output_folder, args, table, vmaf_scores
-            )
+    elif args.target_vmaf is not None:
+        log.info(
+            f"Searching for the value of {args.encoder}'s '-{args.parameter}' parameter between "
+            f"{args.range[0]} and {args.range[1]} that achieves a VMAF of {args.target_vmaf}."
+        )
     else:
         log.info(
             f"Values of {args.encoder}'s '-{args.parameter}' parameter will be compared."
@@ -327,19 +238,109 @@ def main():
         log.info(
             f"The following values will be compared: {', '.join(str(value) for value in args.values)}"
         )
-        for value in args.values:
-            process_parameter_value(
-                value, video_path, output_folder, args, table, vmaf_scores
+
+    metrics_list = get_metrics_list(args)
+    table_path = os.path.join(output_folder, "metrics_table.txt")
+
+    reference = prepare_reference(video_path, output_folder, args)
+    jobs = create_jobs(output_folder, args)
+    result_cache = create_result_cache(args)
+    manifest = Manifest(output_folder, args)
+    frame_store = FrameStore(output_folder, jobs)
+    result_stream = ResultStream(output_folder, args)
+    jobs_by_label = {job.label: job for job in jobs}
+    graph_renderer = None if args.no_graphs else GraphRenderer()
+    completed_results = manifest.load() if args.resume else {}
+
+    if args.target_vmaf is not None:
+        run_sweep = search_target_vmaf
+    elif args.queue:
+        run_sweep = run_jobs_on_workers
+    else:
+        run_sweep = run_jobs
+    results = []
+
+    for result in run_sweep(
+        jobs, video_path, reference, args, result_cache, completed_results
+    ):
+        manifest.record(result)
+        frame_store.record(result)
+        frame_data = frame_store.load(result.label)
+        result_stream.record(result, frame_data)
+
+        if graph_renderer:
+            plot_metric_graphs(
+                graph_renderer,
+                frame_data,
+                result.metric_scores,
+                args,
+                jobs_by_label[result.label].output_folder,
             )
 
+        add_row_to_table(
+            table,
+            result.get_row(
+                metrics_list,
+                args.decimal_places,
+                args.resource_usage,
+                args.benchmark_runs is not None,
+            ),
+        )
+        vmaf_scores.append(result.vmaf_mean)
+        results.append(result)
+
+    result_stream.close()
     line()
     log.info(f"Total Time Taken: {timer.stop(args.decimal_places)}s")
 
-    finalise(filename, output_folder, original_bitrate, args, vmaf_scores)
+    # With --single-pass, the time taken includes the time taken to calculate the metrics.
+    mark_pareto_frontier(table, results, include_time=not args.single_pass)
+    write_table_to_file(
+        table_path,
+        table,
+        metrics_list,
+        args.vmaf_tolerance is not None,
+        args.resource_usage,
+        args.benchmark_runs,
+    )
+
+    if args.target_vmaf is not None:
+        values = [result.label for result in results]
+    else:
+        values = args.values if args.values else args.combinations.split(",")
+
+    finalise(
+        filename,
+        output_folder,
+        original_bitrate,
+        args,
+        values,
+        vmaf_scores,
+        graph_renderer,
+    )
+
+    if args.target_vmaf is not None:
+        report_target_result(table_path, results, args)
+
+    if args.compare_with:
+        report(
+            table_path,
+            compare_sweeps(
+                results,
+                load_results(args.compare_with),
+                args.compare_with,
+                args.decimal_places,
+            ),
+        )
+
+    if graph_renderer:
+        log.info("Waiting for the graphs to be saved...")
+        graph_renderer.join()
 
     line()
     log.info(f"All done! Check out the contents of the '{output_folder}' folder.")
     log.close()
 
 
-main()
+if __name__ == "__main__":
+    main()
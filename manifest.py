@@ -0,0 +1,82 @@
+import json
+import os
+from typing import Dict
+
+from sweep import get_sweep_settings, SweepResult
+from utils import exit_program, get_file_identity, Logger
+
+log = Logger("manifest")
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+class Manifest:
+    """
+    Records the result of each completed value in the output folder, so that an interrupted sweep can be resumed.
+    The manifest is rewritten atomically after every value, so it is never left half-written.
+    """
+
+    def __init__(self, output_folder: str, args):
+        self._path = os.path.join(output_folder, MANIFEST_FILENAME)
+        # The results are only valid for the input video that they were created from.
+        self._settings = {
+            **get_sweep_settings(args),
+            "input": get_file_identity(args.input_video),
+        }
+        self._results = {}
+
+    def load(self) -> Dict[str, SweepResult]:
+        """Load the results of a previous run with the same settings."""
+        if not os.path.exists(self._path):
+            log.info("There is no manifest to resume from, so every value will be run.")
+            return {}
+
+        with open(self._path, "r") as f:
+            try:
+                manifest = json.load(f)
+            except json.JSONDecodeError:
+                exit_program(f"Unable to resume, {self._path} is corrupt.")
+
+        if manifest["settings"].get("input") != self._settings["input"]:
+            exit_program(
+                f"Unable to resume, the results in {self._path} were not created from {self._settings['input']['path']}, "
+                "or it has been modified since."
+            )
+
+        if manifest["settings"] != self._settings:
+            exit_program(
+                f"Unable to resume, the settings in {self._path} do not match the current arguments."
+            )
+
+        self._results = {
+            label: SweepResult.from_dict(result)
+            for label, result in manifest["results"].items()
+        }
+
+        if self._results:
+            log.info(
+                f"Resuming. Results loaded from the manifest: {', '.join(self._results)}"
+            )
+
+        return dict(self._results)
+
+    def record(self, result: SweepResult) -> None:
+        self._results[result.label] = result
+        partial_path = f"{self._path}.partial"
+
+        with open(partial_path, "w") as f:
+            json.dump(
+                {
+                    "settings": self._settings,
+                    "results": {
+                        label: result.to_dict()
+                        for label, result in self._results.items()
+                    },
+                },
+                f,
+                indent=2,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(partial_path, self._path)
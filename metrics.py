@@ -1,12 +1,22 @@
+import csv
 import json
+import math
 import os
+import re
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
 
 import numpy as np
 from prettytable import PrettyTable
 
-from utils import force_decimal_places, line, Logger, plot_graph, get_metrics_list
+from utils import (
+    force_decimal_places,
+    get_metrics_list,
+    GraphRenderer,
+    line,
+    Logger,
+)
 
 log = Logger("save_metrics")
 
@@ -16,112 +26,578 @@ class MetricScores:
     min: float
     std: float
     mean: float
+    # The half-width of the 95% confidence interval of the mean, when only some of the frames were scored.
+    confidence_interval: Optional[float] = None
 
+    def __str__(self) -> str:
+        if self.confidence_interval is None:
+            return f"{self.min} | {self.std} | {self.mean}"
 
-def load_frame_data(json_file_path: str) -> Tuple[List[Dict], List[int]]:
-    if not os.path.isfile(json_file_path):
-        print(f"The following file path does not exist:\n{json_file_path}")
-        return [], []
+        return f"{self.min} | {self.std} | {self.mean} ± {self.confidence_interval}"
 
-    with open(json_file_path, "r") as f:
-        try:
-            file_contents = json.load(f)
-        except json.JSONDecodeError:
-            return [], []
-        else:
-            frames = file_contents["frames"]
-            frame_numbers = [frame["frameNum"] for frame in frames]
 
-            return frames, frame_numbers
+# The key used by libvmaf for each metric.
+METRIC_KEYS = {"VMAF": "vmaf", "PSNR": "psnr_y", "SSIM": "float_ssim"}
+
+# The folder, within each value's output folder, that contains the per-frame scores as .npy files.
+FRAME_COLUMNS_FOLDER = "frame_metrics"
+FRAME_NUMBERS_COLUMN = "frame_numbers"
+
+# Adaptive scoring scores blocks of consecutive frames. Each round scores one block in every ADAPTIVE_BLOCKS_PER_STRIDE blocks.
+# The blocks are at least ADAPTIVE_MIN_BLOCK_SIZE frames long, and longer if the videos have longer keyframe intervals.
+ADAPTIVE_MIN_BLOCK_SIZE = 8
+ADAPTIVE_BLOCKS_PER_STRIDE = 8
+
+
+class FrameData:
+    """
+    Per-frame scores stored in preallocated NumPy arrays, one per metric.
+    Frames are buffered and copied into the arrays in blocks, and the arrays double in size when they are full.
+    """
+
+    BLOCK_SIZE = 8192
+
+    def __init__(self, metric_keys: List[str], capacity: int = BLOCK_SIZE):
+        self._size = 0
+        self._frame_numbers = np.empty(capacity, dtype=np.int64)
+        self._scores = {
+            key: np.empty(capacity, dtype=np.float64) for key in metric_keys
+        }
+        self._pending_frame_numbers = []
+        self._pending_scores = {key: [] for key in metric_keys}
+
+    def append(self, frame_number: int, scores: Dict[str, float]) -> None:
+        self._pending_frame_numbers.append(frame_number)
+        for key, pending in self._pending_scores.items():
+            pending.append(scores.get(key, np.nan))
+
+        if len(self._pending_frame_numbers) == self.BLOCK_SIZE:
+            self._flush()
+
+    @classmethod
+    def from_arrays(
+        cls, frame_numbers: np.ndarray, scores: Dict[str, np.ndarray]
+    ) -> "FrameData":
+        frame_data = cls([])
+        frame_data._frame_numbers = frame_numbers
+        frame_data._scores = scores
+        frame_data._size = len(frame_numbers)
+        return frame_data
+
+    @classmethod
+    def load(cls, folder: str, metric_keys: Optional[List[str]] = None) -> "FrameData":
+        """
+        Memory-map the columns written by save(), rather than reading them into memory.
+        Only the specified metrics are loaded, or every metric in the folder if metric_keys is None.
+        """
+        frame_data = cls([])
+        frame_data._frame_numbers = np.load(
+            os.path.join(folder, f"{FRAME_NUMBERS_COLUMN}.npy"), mmap_mode="r"
+        )
+        frame_data._size = len(frame_data._frame_numbers)
+
+        if metric_keys is None:
+            metric_keys = [
+                key
+                for key, extension in map(os.path.splitext, sorted(os.listdir(folder)))
+                if extension == ".npy" and key != FRAME_NUMBERS_COLUMN
+            ]
+
+        for key in metric_keys:
+            frame_data._scores[key] = np.load(
+                os.path.join(folder, f"{key}.npy"), mmap_mode="r"
+            )
+
+        return frame_data
+
+    def save(self, folder: str) -> None:
+        """
+        Write the frame numbers and each metric to a separate .npy file in the specified folder.
+        The columns of any other metric, left by a previous run with different metrics, are removed.
+        """
+        os.makedirs(folder, exist_ok=True)
+        columns = {FRAME_NUMBERS_COLUMN: self.frame_numbers}
+        columns.update({key: self.get_scores(key) for key in self._scores})
+
+        for key, column in columns.items():
+            path = os.path.join(folder, f"{key}.npy")
+            with open(f"{path}.partial", "wb") as f:
+                np.save(f, column)
+            os.replace(f"{path}.partial", path)
+
+        for filename in os.listdir(folder):
+            key, extension = os.path.splitext(filename)
+            if extension == ".npy" and key not in columns:
+                os.remove(os.path.join(folder, filename))
+
+    @property
+    def metric_keys(self) -> List[str]:
+        return list(self._scores)
+
+    def _flush(self) -> None:
+        if not self._pending_frame_numbers:
+            return
+
+        end = self._size + len(self._pending_frame_numbers)
+
+        while end > len(self._frame_numbers):
+            self._grow()
+
+        self._frame_numbers[self._size : end] = self._pending_frame_numbers
+        self._pending_frame_numbers.clear()
+
+        for key, pending in self._pending_scores.items():
+            self._scores[key][self._size : end] = pending
+            pending.clear()
+
+        self._size = end
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._frame_numbers)
+        self._frame_numbers = np.resize(self._frame_numbers, capacity)
+        self._scores = {
+            key: np.resize(array, capacity) for key, array in self._scores.items()
+        }
+
+    @property
+    def frame_numbers(self) -> np.ndarray:
+        self._flush()
+        return self._frame_numbers[: self._size]
+
+    def get_scores(self, metric_key: str) -> np.ndarray:
+        self._flush()
+        return self._scores[metric_key][: self._size]
+
+    def __len__(self) -> int:
+        return self._size + len(self._pending_frame_numbers)
+
+
+def parse_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def iter_json_frames(
+    log_file_path: str, metric_keys: List[str]
+) -> Iterator[Tuple[int, Dict[str, float]]]:
+    """
+    Read libvmaf's JSON log in chunks rather than loading the whole file into memory.
+    libvmaf writes one key per line, so each chunk is cut at a line break and searched for the keys we need.
+    Files with a different layout are loaded with the json module instead.
+    """
+    key_pattern = re.compile(
+        r'"(frameNum|pooled_metrics|aggregate_metrics|'
+        + "|".join(re.escape(key) for key in metric_keys)
+        + r')":\s*([^,\s{}]*)'
+    )
+    frame_number = None
+    scores = {}
+    found_frames = False
+    remainder = ""
+
+    with open(log_file_path, "r") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            text = remainder + chunk
+            if chunk:
+                cut = text.rfind("\n") + 1
+                text, remainder = text[:cut], text[cut:]
+
+            for match in key_pattern.finditer(text):
+                key, value = match.groups()
+
+                if key == "frameNum":
+                    if frame_number is not None:
+                        yield frame_number, scores
+                    frame_number = int(value)
+                    scores = {}
+                    found_frames = True
+                elif key in ("pooled_metrics", "aggregate_metrics"):
+                    # Only the per-frame scores are needed.
+                    chunk = ""
+                    break
+                elif frame_number is not None:
+                    number = parse_number(value)
+                    if number is not None:
+                        scores[key] = number
+
+            if not chunk:
+                break
+
+    if frame_number is not None:
+        yield frame_number, scores
+
+    if not found_frames:
+        with open(log_file_path, "r") as f:
+            for frame in json.load(f).get("frames", []):
+                yield frame["frameNum"], frame["metrics"]
+
+
+def iter_csv_frames(
+    log_file_path: str, metric_keys: List[str]
+) -> Iterator[Tuple[int, Dict[str, float]]]:
+    with open(log_file_path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        columns = {key: header.index(key) for key in metric_keys if key in header}
+
+        for row in reader:
+            if not row:
+                continue
+
+            scores = {}
+            for key, column in columns.items():
+                number = parse_number(row[column])
+                if number is not None:
+                    scores[key] = number
+
+            yield int(row[0]), scores
+
+
+def iter_xml_frames(
+    log_file_path: str, metric_keys: List[str]
+) -> Iterator[Tuple[int, Dict[str, float]]]:
+    frames_element = None
+
+    for event, element in ElementTree.iterparse(log_file_path, events=("start", "end")):
+        if event == "start":
+            if element.tag == "frames":
+                frames_element = element
+            continue
+
+        if element.tag != "frame":
+            continue
+
+        scores = {}
+        for key in metric_keys:
+            number = parse_number(element.get(key, ""))
+            if number is not None:
+                scores[key] = number
+
+        yield int(element.get("frameNum")), scores
+
+        # Discard the parsed frame so that memory usage does not grow with the number of frames.
+        element.clear()
+        if frames_element is not None:
+            frames_element.remove(element)
+
+
+FRAME_ITERATORS = {
+    ".json": iter_json_frames,
+    ".csv": iter_csv_frames,
+    ".xml": iter_xml_frames,
+}
+
+
+def write_json_frames(frame_data: FrameData, log_file_path: str) -> None:
+    frames = [
+        {
+            "frameNum": int(frame_number),
+            "metrics": {
+                key: float(frame_data.get_scores(key)[i])
+                for key in frame_data.metric_keys
+            },
+        }
+        for i, frame_number in enumerate(frame_data.frame_numbers)
+    ]
+
+    with open(log_file_path, "w") as f:
+        # One key per line, like libvmaf, so that iter_json_frames can read it.
+        json.dump({"frames": frames}, f, indent=4)
+
+
+def write_csv_frames(frame_data: FrameData, log_file_path: str) -> None:
+    columns = [frame_data.get_scores(key) for key in frame_data.metric_keys]
+
+    with open(log_file_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Frame"] + frame_data.metric_keys)
+        for i, frame_number in enumerate(frame_data.frame_numbers):
+            writer.writerow([frame_number] + [column[i] for column in columns])
+
+
+def write_xml_frames(frame_data: FrameData, log_file_path: str) -> None:
+    root = ElementTree.Element("VMAF")
+    frames_element = ElementTree.SubElement(root, "frames")
+
+    for i, frame_number in enumerate(frame_data.frame_numbers):
+        ElementTree.SubElement(
+            frames_element,
+            "frame",
+            {"frameNum": str(frame_number)}
+            | {
+                key: str(frame_data.get_scores(key)[i])
+                for key in frame_data.metric_keys
+            },
+        )
+
+    ElementTree.ElementTree(root).write(log_file_path)
+
+
+FRAME_WRITERS = {
+    ".json": write_json_frames,
+    ".csv": write_csv_frames,
+    ".xml": write_xml_frames,
+}
+
+
+def write_frame_log(frame_data: FrameData, log_file_path: str) -> None:
+    """Write per-frame scores that were merged from several libvmaf logs in the same format as libvmaf."""
+    FRAME_WRITERS[os.path.splitext(log_file_path)[1]](frame_data, log_file_path)
+
+
+def load_frame_data(log_file_path: str, metric_keys: List[str]) -> FrameData:
+    """Read the per-frame scores of the specified metrics from a libvmaf log in a single pass."""
+    frame_data = FrameData(metric_keys)
+
+    if not os.path.isfile(log_file_path):
+        print(f"The following file path does not exist:\n{log_file_path}")
+        return frame_data
+
+    iter_frames = FRAME_ITERATORS[os.path.splitext(log_file_path)[1]]
+
+    try:
+        for frame_number, scores in iter_frames(log_file_path, metric_keys):
+            frame_data.append(frame_number, scores)
+    except (json.JSONDecodeError, ElementTree.ParseError, ValueError) as error:
+        log.info(f"Unable to parse {log_file_path}: {error}")
+        return FrameData(metric_keys)
+
+    return frame_data
+
+
+def get_adaptive_block_size(frame_numbers: np.ndarray) -> Optional[int]:
+    """
+    The size of the blocks that adaptive scoring scored. Every run of consecutive scored frames starts at a multiple
+    of the block size, and so does every run except the last one end, so the block size is their greatest common divisor.
+    Return None if the frames are a single run, which adaptive scoring only stops at once every frame has been scored.
+    """
+    frame_numbers = np.sort(frame_numbers)
+    run_starts = np.flatnonzero(np.diff(frame_numbers) != 1) + 1
+
+    if not len(run_starts):
+        return None
+
+    return int(
+        np.gcd.reduce(
+            np.concatenate(
+                [frame_numbers[run_starts], frame_numbers[run_starts - 1] + 1]
+            )
+        )
+    )
+
+
+def get_confidence_interval(
+    frame_numbers: np.ndarray, scores: np.ndarray, block_size: Optional[int] = None
+) -> float:
+    """
+    The half-width of the 95% confidence interval of the mean score of a video, when only some of the blocks of frames
+    were scored by adaptive scoring. The frames within a block are similar, so each block is treated as one sample.
+    If block_size is not specified, it is found from the frame numbers.
+    """
+    if block_size is None:
+        block_size = get_adaptive_block_size(frame_numbers)
+
+        if block_size is None:
+            return 0.0
+
+    blocks, block_indices = np.unique(frame_numbers // block_size, return_inverse=True)
+
+    if len(blocks) < 2:
+        return math.inf
+
+    block_means = np.bincount(block_indices, weights=scores) / np.bincount(
+        block_indices
+    )
+    # The proportion of the blocks that were scored, e.g. 1/8 after the first round.
+    sampled_fraction = (
+        len(np.unique(blocks % ADAPTIVE_BLOCKS_PER_STRIDE)) / ADAPTIVE_BLOCKS_PER_STRIDE
+    )
+
+    return (
+        1.96
+        * np.std(block_means, ddof=1)
+        / math.sqrt(len(blocks))
+        * math.sqrt(1 - sampled_fraction)
+    )
 
 
 def calculate_metric_scores(
-    metric_scores: List[float], decimal_places: int
+    metric_scores: np.ndarray,
+    decimal_places: Optional[int],
+    frame_numbers: Optional[np.ndarray] = None,
 ) -> MetricScores:
-    """Calculate statistical scores for a given metric."""
+    """
+    Calculate statistical scores for a given metric, rounded to decimal_places, or as floats if it is None.
+    If frame_numbers is specified, the frames were sampled by adaptive scoring and the confidence interval is included.
+    """
+
+    def round_score(score):
+        if decimal_places is None:
+            return float(score)
+
+        return force_decimal_places(score, decimal_places)
+
     return MetricScores(
-        min=force_decimal_places(min(metric_scores), decimal_places),
-        std=force_decimal_places(np.std(metric_scores), decimal_places),
-        mean=force_decimal_places(np.mean(metric_scores), decimal_places),
+        min=round_score(np.min(metric_scores)),
+        std=round_score(np.std(metric_scores)),
+        mean=round_score(np.mean(metric_scores)),
+        confidence_interval=(
+            round_score(get_confidence_interval(frame_numbers, metric_scores))
+            if frame_numbers is not None
+            else None
+        ),
     )
 
 
 def process_metric(
     metric_type: str,
-    frames: List[Dict],
-    frame_numbers: List[int],
-    args,
-    output_folder: str,
-    decimal_places: int,
+    frame_data: FrameData,
+    decimal_places: Optional[int],
+    sampled: bool,
 ) -> Optional[MetricScores]:
-    metric_lookup = {"VMAF": "vmaf", "PSNR": "psnr_y", "SSIM": "float_ssim"}
-    metric_key = metric_lookup[metric_type]
+    if len(frame_data) and METRIC_KEYS[metric_type] in frame_data.metric_keys:
+        metric_scores = frame_data.get_scores(METRIC_KEYS[metric_type])
 
-    if len(frames):
-        if not frames[0]["metrics"][metric_key]:
+        if np.isnan(metric_scores[0]):
             return None
 
-        metric_scores = [frame["metrics"][metric_key] for frame in frames]
-        scores = calculate_metric_scores(metric_scores, decimal_places)
+        return calculate_metric_scores(
+            metric_scores,
+            decimal_places,
+            np.asarray(frame_data.frame_numbers) if sampled else None,
+        )
+
+
+def downsample(
+    x_values: np.ndarray, y_values: np.ndarray, max_points: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce the number of points to at most max_points by splitting the values into buckets
+    and keeping the minimum and maximum of each bucket, so that short dips are still visible.
+    """
+    num_values = len(y_values)
+
+    if not max_points or num_values <= max_points:
+        return x_values, y_values
+
+    # Two points per bucket, plus the first and last frames.
+    bucket_size = math.ceil(num_values / ((max_points - 2) // 2))
+    num_buckets = math.ceil(num_values / bucket_size)
+    # Pad the last bucket by repeating the last value.
+    buckets = np.pad(
+        y_values, (0, num_buckets * bucket_size - num_values), mode="edge"
+    ).reshape(num_buckets, bucket_size)
+
+    offsets = np.arange(num_buckets) * bucket_size
+    indices = np.concatenate(
+        [
+            [0, num_values - 1],
+            offsets + buckets.argmin(axis=1),
+            offsets + buckets.argmax(axis=1),
+        ]
+    )
+    indices = np.unique(np.minimum(indices, num_values - 1))
+
+    return x_values[indices], y_values[indices]
+
 
-        plot_graph(
+def plot_metric_graphs(
+    graph_renderer: GraphRenderer,
+    frame_data: FrameData,
+    metric_scores: Dict[str, MetricScores],
+    args,
+    output_folder: str,
+) -> None:
+    """Plot the per-frame scores of each metric in the background."""
+    for metric_type, scores in metric_scores.items():
+        frame_numbers, per_frame_scores = downsample(
+            np.asarray(frame_data.frame_numbers),
+            np.asarray(frame_data.get_scores(METRIC_KEYS[metric_type])),
+            args.graph_points,
+        )
+
+        graph_renderer.plot_graph(
             f"{metric_type}\nlibvmaf n_subsample: {args.n_subsample}",
             "Frame Number",
             metric_type,
             frame_numbers,
-            metric_scores,
+            per_frame_scores,
             scores.mean,
             os.path.join(output_folder, metric_type),
         )
 
-        return scores
-
 
 def write_table_to_file(
-    table_path: str, table: PrettyTable, metric_types: List[str]
+    table_path: str,
+    table: PrettyTable,
+    metric_types: List[str],
+    confidence_intervals: bool = False,
+    resource_usage: bool = False,
+    benchmark_runs: Optional[int] = None,
 ) -> None:
     collected_metric_types = "/".join(metric_types)
     table_title = f"{collected_metric_types} values are in the format: Min | Standard Deviation | Mean"
 
+    if confidence_intervals:
+        table_title += (
+            " ± 95% confidence interval (only some of the frames were scored)"
+        )
+
+    if resource_usage:
+        table_title += (
+            "\nResource usage values are in the format: "
+            "CPU User Time (s) | CPU System Time (s) | Peak RSS | FPS"
+        )
+
+    if benchmark_runs is not None:
+        table_title += (
+            "\nEncoding Time (s) and Encoding FPS values are in the format: "
+            f"Median [Min–Max] of {benchmark_runs} run(s)"
+        )
+
     with open(table_path, "w") as f:
         f.write(f"{table_title}\n")
         f.write(table.get_string())
 
 
-def process_metrics(
-    comparison_table: str,
-    json_file_path: str,
-    args,
-    decimal_places: int,
-    data_for_current_row: List[str],
-    table: PrettyTable,
-    output_folder: str,
-    time_taken: Optional[float],
-    first_column_data: str,
-) -> float:
-    frames, frame_numbers = load_frame_data(json_file_path)
+def get_metric_scores(
+    frame_data: FrameData, args, decimal_places: Optional[int]
+) -> Dict[str, MetricScores]:
+    metric_scores = {}
 
-    metrics_list = get_metrics_list(args)
-    vmaf_mean = None
-
-    for metric_type in metrics_list:
+    for metric_type in get_metrics_list(args):
         scores = process_metric(
-            metric_type, frames, frame_numbers, args, output_folder, decimal_places
+            metric_type, frame_data, decimal_places, args.vmaf_tolerance is not None
         )
 
         if scores:
-            data_for_current_row.append(f"{scores.min} | {scores.std} | {scores.mean}")
-            if metric_type == "VMAF":
-                vmaf_mean = scores.mean
+            metric_scores[metric_type] = scores
+
+    return metric_scores
 
-    data_for_current_row.insert(0, first_column_data)
-    data_for_current_row.insert(1, time_taken)
 
+def process_metrics(
+    log_file_path: str,
+    args,
+    output_folder: str,
+    decimal_places: int,
+) -> Dict[str, MetricScores]:
+    metrics_list = get_metrics_list(args)
+    frame_data = load_frame_data(
+        str(log_file_path), [METRIC_KEYS[metric_type] for metric_type in metrics_list]
+    )
+    # Keep the parsed scores so that they can be memory-mapped later instead of parsing the log again.
+    frame_data.save(os.path.join(output_folder, FRAME_COLUMNS_FOLDER))
+
+    return get_metric_scores(frame_data, args, decimal_places)
+
+
+def add_row_to_table(table: PrettyTable, data_for_current_row: List[str]) -> None:
     # Pad the row if it has fewer elements than the number of columns
     while len(data_for_current_row) < len(table._field_names):
         data_for_current_row.append("")
 
     table.add_row(data_for_current_row)
-    write_table_to_file(comparison_table, table, metrics_list)
-
-    return float(vmaf_mean) if vmaf_mean is not None else 0
@@ -1,9 +1,10 @@
 import math
 import os
 from pathlib import Path
-import shutil
 import subprocess
 
+import numpy as np
+
 from utils import VideoInfoProvider, line, exit_program, Logger
 
 log = Logger("overview")
@@ -17,11 +18,8 @@ class ConcatenateError(Exception):
     pass
 
 
-def create_clips(input_video, output_folder, interval_seconds, clip_length):
-    # The output folder for the clips.
-    output_folder = os.path.join(output_folder, "clips")
-    os.makedirs(output_folder, exist_ok=True)
-
+def get_clip_positions(input_video, interval_seconds):
+    """The position (in seconds) of each clip, one every interval_seconds."""
     provider = VideoInfoProvider(input_video)
     duration = int(float(provider.get_duration()))
 
@@ -32,60 +30,103 @@ def create_clips(input_video, output_folder, interval_seconds, clip_length):
 
     num_clips = math.trunc(duration / interval_seconds)
 
-    txt_file_path = os.path.join(output_folder, "clips.txt")
-    # Create the file.
-    open(txt_file_path, "w").close()
+    return [clip_number * interval_seconds for clip_number in range(1, num_clips)]
+
+
+def get_scene_scores(input_video):
+    """
+    Get the scene score (the difference from the previous frame, from 0 to 1) of every frame in a single pass.
+    The video is downscaled first, as the scores only need to be approximate.
+    """
+    result = subprocess.run(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-i",
+            input_video,
+            "-map",
+            "0:V:0",
+            "-vf",
+            "scale=160:-2,select='gte(scene,0)',metadata=print:key=lavfi.scene_score:file=-",
+            "-f",
+            "null",
+            "-",
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    if result.returncode != 0:
+        raise ClipError(f"Unable to analyse {input_video}:\n{result.stderr}")
+
+    timestamps = []
+    scene_scores = []
+
+    for output_line in result.stdout.splitlines():
+        if output_line.startswith("frame:"):
+            timestamps.append(float(output_line.rsplit("pts_time:", 1)[1]))
+        elif output_line.startswith("lavfi.scene_score="):
+            scene_scores.append(float(output_line.split("=", 1)[1]))
+
+    return np.array(timestamps[: len(scene_scores)]), np.array(scene_scores)
+
+
+def select_stratified_clips(input_video, clip_positions, clip_length, num_clips):
+    """
+    Pick num_clips of the clips so that they cover the range of content difficulty.
+    The complexity of each clip is its mean scene score. The clips are sorted by complexity and split into num_clips
+    equally sized groups, and the clip closest to the median complexity of each group is used.
+    """
+    if num_clips >= len(clip_positions):
+        return clip_positions
+
+    log.info("Analysing the scene changes and complexity of the video...")
+    timestamps, scene_scores = get_scene_scores(input_video)
+
+    complexities = []
+    for position in clip_positions:
+        in_clip = (timestamps >= position) & (timestamps < position + clip_length)
+        complexities.append(scene_scores[in_clip].mean() if in_clip.any() else 0)
+
+    complexities = np.array(complexities)
+    selected_positions = []
+
+    for group in np.array_split(np.argsort(complexities, kind="stable"), num_clips):
+        median = np.median(complexities[group])
+        selected_positions.append(
+            clip_positions[group[np.argmin(np.abs(complexities[group] - median))]]
+        )
 
+    selected_positions.sort()
     log.info(
-        f"Creating a {clip_length} second clip every {interval_seconds} seconds from {input_video}..."
+        f"Using {num_clips} of {len(clip_positions)} clips, at: "
+        f"{', '.join(f'{position}s' for position in selected_positions)}"
     )
-    line()
 
-    try:
-        for clip_number in range(1, num_clips):
-            clip_name = f"clip{clip_number}.mkv"
-
-            with open(txt_file_path, "a") as f:
-                f.write(f"file '{clip_name}'\n")
-
-            seek_position = clip_number * interval_seconds
-            clip_output_path = os.path.join(output_folder, clip_name)
-
-            log.info(f"Creating clip {clip_number}...")
-
-            subprocess_cut_args = [
-                "ffmpeg",
-                "-loglevel",
-                "quiet",
-                "-stats",
-                "-y",
-                "-ss",
-                str(seek_position),
-                "-i",
-                input_video,
-                "-map",
-                "0:V",
-                "-t",
-                clip_length,
-                "-c:V",
-                "copy",
-                clip_output_path,
-            ]
-
-            subprocess.run(subprocess_cut_args)
-
-    except Exception as error:
-        log.info("An error occurred while trying to create the clips.")
-        exit_program(error)
-
-    else:
-        return txt_file_path
-
-
-def concatenate_clips(txt_file_path, output_folder, extension):
-    if not os.path.exists(txt_file_path):
-        raise ConcatenateError(f"{txt_file_path} does not exist.")
+    return selected_positions
+
+
+def create_concat_list(input_video, clip_positions, clip_length):
+    """
+    Create a concat demuxer script that reads each clip straight from the input video using inpoint and outpoint,
+    so that the clips do not need to be cut into separate files first.
+    """
+    if os.path.exists(input_video):
+        # The script is read from stdin, so relative paths and paths containing a colon would not resolve.
+        input_video = f"file:{os.path.abspath(input_video)}"
+
+    escaped_input_video = input_video.replace("'", "'\\''")
+
+    return "".join(
+        f"file '{escaped_input_video}'\n"
+        f"inpoint {position}\n"
+        f"outpoint {position + float(clip_length)}\n"
+        for position in clip_positions
+    )
 
+
+def concatenate_clips(concat_list, output_folder, extension):
     overview_filename = f"Overview_Video{extension}"
     concatenated_filepath = os.path.join(output_folder, overview_filename)
 
@@ -99,32 +140,49 @@ def concatenate_clips(txt_file_path, output_folder, extension):
         "concat",
         "-safe",
         "0",
+        "-protocol_whitelist",
+        "file,pipe,http,https,tcp,tls,crypto",
         "-i",
-        txt_file_path,
+        "pipe:0",
+        "-map",
+        "0:V",
         "-c",
         "copy",
         concatenated_filepath,
     ]
 
-    line()
-    log.info("Concatenating the clips to create the overview video...")
-    result = subprocess.run(subprocess_concatenate_args)
+    result = subprocess.run(subprocess_concatenate_args, input=concat_list.encode())
     log.info("Done!")
-    shutil.rmtree(os.path.join(output_folder, "clips"))
-    log.info("The clips have been deleted as they are no longer needed.")
 
-    if result.returncode == 0:
-        return concatenated_filepath
+    if result.returncode != 0:
+        raise ConcatenateError("An error occurred while creating the overview video.")
+
+    return concatenated_filepath
 
 
-def create_overview_video(input_video, output_folder, interval_seconds, clip_length):
+def create_overview_video(
+    input_video, output_folder, interval_seconds, clip_length, stratified_clips=None
+):
     os.makedirs(output_folder, exist_ok=True)
     extension = Path(input_video).suffix
     try:
-        txt_file_path = create_clips(
-            input_video, output_folder, interval_seconds, clip_length
+        clip_positions = get_clip_positions(input_video, interval_seconds)
+
+        if stratified_clips:
+            clip_positions = select_stratified_clips(
+                input_video, clip_positions, float(clip_length), stratified_clips
+            )
+
+        log.info(
+            f"Creating an overview video from {len(clip_positions)} clips of {input_video}, each {clip_length} seconds long..."
+        )
+        line()
+
+        output_file = concatenate_clips(
+            create_concat_list(input_video, clip_positions, clip_length),
+            output_folder,
+            extension,
         )
-        output_file = concatenate_clips(txt_file_path, output_folder, extension)
         result = True
     except ClipError as err:
         result = False
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+import hashlib
+import os
+from typing import Optional
+
+from utils import line, Logger, Timer
+
+log = Logger("reference_cache")
+
+# The codec and container used for each type of cached reference.
+CACHE_FORMATS = {
+    "ffv1": (["-c:v", "ffv1", "-level", "3", "-g", "1"], "matroska", ".mkv"),
+    "rawvideo": (["-c:v", "rawvideo"], "nut", ".nut"),
+}
+
+
+@dataclass
+class ReferenceVideo:
+    """The video that the transcodes are compared against, and the filters to apply to it."""
+
+    path: str
+    video_filters: Optional[str] = None
+
+
+def get_cache_key(
+    video_path: str, video_filters: Optional[str], cache_format: str
+) -> str:
+    stat = os.stat(video_path)
+    key_data = "\n".join(
+        [
+            os.path.abspath(video_path),
+            str(stat.st_size),
+            str(stat.st_mtime_ns),
+            video_filters or "",
+            cache_format,
+        ]
+    )
+    return hashlib.sha256(key_data.encode()).hexdigest()[:16]
+
+
+def remove_stale_references(cache_folder: str, current_filename: str) -> None:
+    for filename in os.listdir(cache_folder):
+        if filename != current_filename:
+            os.remove(os.path.join(cache_folder, filename))
+            log.info(f"Removed stale cached reference: {filename}")
+
+
+def prepare_reference(video_path: str, output_folder: str, args) -> ReferenceVideo:
+    """
+    Decode the reference and apply --video-filters to it once, so that every libvmaf run reads
+    the cached result instead of decoding and filtering the original video again.
+    """
+    if not args.cache_reference:
+        return ReferenceVideo(video_path, args.video_filters)
+
+    codec_arguments, container, extension = CACHE_FORMATS[args.cache_reference]
+    cache_folder = os.path.join(output_folder, "reference_cache")
+    os.makedirs(cache_folder, exist_ok=True)
+
+    cache_filename = f"{get_cache_key(video_path, args.video_filters, args.cache_reference)}{extension}"
+    cache_path = os.path.join(cache_folder, cache_filename)
+    remove_stale_references(cache_folder, cache_filename)
+
+    if os.path.exists(cache_path):
+        log.info(f"Using the cached reference: {cache_path}")
+        line()
+        return ReferenceVideo(cache_path)
+
+    # Write to a temporary file first so that an interrupted run never leaves a partial cache behind.
+    partial_path = f"{cache_path}.partial"
+    arguments = ["ffmpeg", "-y", "-i", video_path, "-map", "0:V:0"]
+
+    if args.video_filters:
+        arguments.extend(["-vf", args.video_filters])
+
+    arguments.extend(codec_arguments + ["-f", container, partial_path])
+
+    # Not imported at startup, as it is slow to import (see run_ffmpeg).
+    from better_ffmpeg_progress import FfmpegProcess
+
+    process = FfmpegProcess(
+        arguments,
+        ffmpeg_log_file=os.path.join(cache_folder, "ffmpeg_log.txt"),
+        print_detected_duration=False,
+    )
+
+    log.info(
+        f"Decoding the reference once and caching it ({args.cache_reference})...\n"
+    )
+    timer = Timer()
+    timer.start()
+    process.run()
+    log.info(f"Time Taken: {timer.stop(args.decimal_places)}s")
+    line()
+
+    os.replace(partial_path, cache_path)
+    os.remove(os.path.join(cache_folder, "ffmpeg_log.txt"))
+
+    return ReferenceVideo(cache_path)
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Optional
+
+from metrics import FRAME_COLUMNS_FOLDER, FrameData, get_metric_scores, METRIC_KEYS
+from sweep import (
+    get_benchmark_runs,
+    get_log_file_path,
+    get_sweep_settings,
+    SweepJob,
+    SweepResult,
+)
+from utils import get_file_identity, get_metrics_list, Logger, ResourceUsage
+
+log = Logger("result_cache")
+
+RESULT_FILENAME = "result.json"
+# The hashes of the input videos, so that an unchanged video is not hashed again.
+INPUT_HASHES_FILENAME = "input_hashes.json"
+
+
+def hash_input(video_path: str, cache_folder: str) -> str:
+    """
+    Hash the contents of the input video, or the URL if it is not a local file.
+    The hash is stored in the cache folder with the video's size and modification time,
+    and is only calculated again if either of them has changed.
+    """
+    sha256 = hashlib.sha256()
+
+    if not os.path.isfile(video_path):
+        sha256.update(video_path.encode())
+        return sha256.hexdigest()
+
+    identity = get_file_identity(video_path)
+    input_hashes_path = os.path.join(cache_folder, INPUT_HASHES_FILENAME)
+
+    try:
+        with open(input_hashes_path, "r") as f:
+            input_hashes = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        input_hashes = {}
+
+    stored = input_hashes.get(identity["path"], {})
+    if (stored.get("size"), stored.get("mtime_ns")) == (
+        identity["size"],
+        identity["mtime_ns"],
+    ):
+        return stored["sha256"]
+
+    log.info("Hashing the input video for the result cache...")
+
+    with open(video_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+
+    input_hashes[identity["path"]] = {
+        "size": identity["size"],
+        "mtime_ns": identity["mtime_ns"],
+        "sha256": sha256.hexdigest(),
+    }
+    # Write a temporary file and rename it, so that other processes never read a partial file.
+    partial_path = f"{input_hashes_path}.partial-{os.getpid()}"
+    with open(partial_path, "w") as f:
+        json.dump(input_hashes, f)
+    os.replace(partial_path, input_hashes_path)
+
+    return sha256.hexdigest()
+
+
+def get_folder_size(folder: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, filename))
+        for root, _, filenames in os.walk(folder)
+        for filename in filenames
+    )
+
+
+def is_valid_entry(entry_folder: str) -> bool:
+    try:
+        with open(os.path.join(entry_folder, RESULT_FILENAME), "r") as f:
+            json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return False
+
+    return True
+
+
+class ResultCache:
+    """
+    A persistent cache of transcode results, keyed on everything that affects the encode and the metrics.
+    Each entry stores the encoding time, size, bitrate and the per-frame metrics, both as the libvmaf log and as .npy columns.
+    The least recently used entries are evicted when the cache exceeds max_size_bytes.
+    """
+
+    def __init__(self, cache_folder: str, max_size_bytes: int, input_hash: str):
+        self._cache_folder = cache_folder
+        self._max_size_bytes = max_size_bytes
+        self._input_hash = input_hash
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def _get_key(self, job: SweepJob, args) -> str:
+        key_data = {
+            **get_sweep_settings(args),
+            "input": self._input_hash,
+            "encoder_threads": args.encoder_threads,
+            "value": job.value,
+            "combination": job.combination_list,
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def load(self, job: SweepJob, args) -> Optional[SweepResult]:
+        entry_folder = os.path.join(self._cache_folder, self._get_key(job, args))
+        result_path = os.path.join(entry_folder, RESULT_FILENAME)
+
+        try:
+            with open(result_path, "r") as f:
+                cached = json.load(f)
+
+            os.makedirs(job.output_folder, exist_ok=True)
+            log_file_path = get_log_file_path(job, args)
+            shutil.copyfile(
+                os.path.join(entry_folder, log_file_path.name), log_file_path
+            )
+            columns_folder = os.path.join(job.output_folder, FRAME_COLUMNS_FOLDER)
+            # Replace the columns of any previous run, which may include other metrics.
+            shutil.rmtree(columns_folder, ignore_errors=True)
+            shutil.copytree(
+                os.path.join(entry_folder, FRAME_COLUMNS_FOLDER), columns_folder
+            )
+            # Mark the entry as recently used.
+            os.utime(result_path)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        log.info(f"Using the cached result for {job.description}.")
+
+        return SweepResult(
+            job.label,
+            cached["time_taken"],
+            cached["size_bytes"],
+            cached["bitrate"],
+            get_metric_scores(
+                FrameData.load(
+                    columns_folder,
+                    [
+                        METRIC_KEYS[metric_type]
+                        for metric_type in get_metrics_list(args)
+                    ],
+                ),
+                args,
+                args.decimal_places,
+            ),
+            *(
+                ResourceUsage(**cached[key]) if cached.get(key) else None
+                for key in ("encoding_usage", "scoring_usage")
+            ),
+            get_benchmark_runs(cached),
+        )
+
+    def store(self, job: SweepJob, result: SweepResult, args) -> None:
+        key = self._get_key(job, args)
+        entry_folder = os.path.join(self._cache_folder, key)
+        # Build the entry in a temporary folder so that a partial entry is never visible.
+        partial_folder = f"{entry_folder}.partial-{os.getpid()}"
+        os.makedirs(partial_folder, exist_ok=True)
+
+        log_file_path = get_log_file_path(job, args)
+        shutil.copyfile(log_file_path, os.path.join(partial_folder, log_file_path.name))
+        shutil.copytree(
+            os.path.join(job.output_folder, FRAME_COLUMNS_FOLDER),
+            os.path.join(partial_folder, FRAME_COLUMNS_FOLDER),
+        )
+
+        result_dict = result.to_dict()
+        with open(os.path.join(partial_folder, RESULT_FILENAME), "w") as f:
+            json.dump(
+                {
+                    key: result_dict[key]
+                    for key in (
+                        "time_taken",
+                        "size_bytes",
+                        "bitrate",
+                        "encoding_usage",
+                        "scoring_usage",
+                        "benchmark_runs",
+                    )
+                },
+                f,
+            )
+
+        # os.replace cannot replace a folder that is not empty, so move any existing entry out of the way first.
+        # It was not loaded, so it is corrupt or was partly evicted.
+        stale_folder = f"{entry_folder}.stale-{os.getpid()}"
+        try:
+            os.rename(entry_folder, stale_folder)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(stale_folder, ignore_errors=True)
+
+        try:
+            os.replace(partial_folder, entry_folder)
+        except OSError:
+            shutil.rmtree(partial_folder, ignore_errors=True)
+
+            # Ignore the error if another process stored the same entry in the meantime.
+            if not is_valid_entry(entry_folder):
+                raise
+
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for key in os.listdir(self._cache_folder):
+            if ".partial-" in key or ".stale-" in key:
+                continue
+
+            entry_folder = os.path.join(self._cache_folder, key)
+            try:
+                last_used = os.path.getmtime(
+                    os.path.join(entry_folder, RESULT_FILENAME)
+                )
+                entries.append((last_used, get_folder_size(entry_folder), entry_folder))
+            except OSError:
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, entry_folder in sorted(entries):
+            if total_size <= self._max_size_bytes:
+                break
+            shutil.rmtree(entry_folder, ignore_errors=True)
+            total_size -= size
+            log.debug(f"Evicted {entry_folder} from the result cache.")
+
+
+def create_result_cache(args) -> Optional[ResultCache]:
+    if not args.result_cache:
+        return None
+
+    os.makedirs(args.result_cache, exist_ok=True)
+
+    # The original input is hashed rather than the cut or overview video, as those are recreated on every run.
+    return ResultCache(
+        args.result_cache,
+        args.result_cache_size * 1_000_000,
+        hash_input(args.input_video, args.result_cache),
+    )
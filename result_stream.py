@@ -0,0 +1,130 @@
+import csv
+import json
+import os
+from statistics import median
+from typing import Dict, List, Optional
+
+from metrics import FrameData, get_metric_scores
+from sweep import SweepResult
+from utils import get_metrics_list, ResourceUsage
+
+RESULTS_JSONL_FILENAME = "results.jsonl"
+RESULTS_CSV_FILENAME = "results.csv"
+
+METRIC_STATISTICS = ["min", "std", "mean", "confidence_interval"]
+RESOURCE_USAGE_FIELDS = [
+    "wall_time",
+    "user_time",
+    "system_time",
+    "peak_rss",
+    "frames",
+    "fps",
+]
+BENCHMARK_FIELDS = ["runs", "time_min", "time_max", "fps_median", "fps_min", "fps_max"]
+
+
+def get_field_names(metrics_list: List[str]) -> List[str]:
+    """Every record has the same fields, so that the CSV header can be written before the first result."""
+    return (
+        ["label", "time_taken", "size_bytes", "bitrate"]
+        + [
+            f"{metric_type.lower()}_{statistic}"
+            for metric_type in metrics_list
+            for statistic in METRIC_STATISTICS
+        ]
+        + [
+            f"{prefix}_{field}"
+            for prefix in ("encoding", "scoring")
+            for field in RESOURCE_USAGE_FIELDS
+        ]
+        + [f"benchmark_{field}" for field in BENCHMARK_FIELDS]
+    )
+
+
+def get_resource_usage_fields(
+    prefix: str, usage: Optional[ResourceUsage]
+) -> Dict[str, Optional[float]]:
+    return {
+        f"{prefix}_{field}": getattr(usage, field) if usage else None
+        for field in RESOURCE_USAGE_FIELDS
+    }
+
+
+def get_benchmark_fields(result: SweepResult) -> Dict[str, Optional[float]]:
+    if not result.benchmark_runs:
+        return {f"benchmark_{field}": None for field in BENCHMARK_FIELDS}
+
+    times = [run.wall_time for run in result.benchmark_runs]
+    fps = [run.fps for run in result.benchmark_runs]
+
+    # The median time is the result's time_taken.
+    return {
+        "benchmark_runs": len(result.benchmark_runs),
+        "benchmark_time_min": min(times),
+        "benchmark_time_max": max(times),
+        "benchmark_fps_median": median(fps),
+        "benchmark_fps_min": min(fps),
+        "benchmark_fps_max": max(fps),
+    }
+
+
+class ResultStream:
+    """
+    Appends a record of each result to results.jsonl and results.csv in the output folder as soon as it is available,
+    so that other tools can read the results without parsing the table, even while the sweep is running.
+    The metric scores are calculated from the per-frame scores without rounding them to --decimal-places.
+    Both files are started afresh by each run, so the results loaded with --resume are recorded again.
+    """
+
+    def __init__(self, output_folder: str, args):
+        self._args = args
+        self._metrics_list = get_metrics_list(args)
+        self._field_names = get_field_names(self._metrics_list)
+
+        self._jsonl_file = open(
+            os.path.join(output_folder, RESULTS_JSONL_FILENAME), "w"
+        )
+        self._csv_file = open(
+            os.path.join(output_folder, RESULTS_CSV_FILENAME), "w", newline=""
+        )
+        self._csv_writer = csv.DictWriter(self._csv_file, self._field_names)
+        self._csv_writer.writeheader()
+        self._csv_file.flush()
+
+    def get_record(self, result: SweepResult, frame_data: FrameData) -> Dict:
+        record = {
+            "label": result.label,
+            "time_taken": result.time_taken,
+            "size_bytes": result.size_bytes,
+            "bitrate": result.bitrate,
+        }
+
+        metric_scores = get_metric_scores(frame_data, self._args, None)
+
+        for metric_type in self._metrics_list:
+            scores = metric_scores.get(metric_type)
+            for statistic in METRIC_STATISTICS:
+                record[f"{metric_type.lower()}_{statistic}"] = (
+                    getattr(scores, statistic) if scores else None
+                )
+
+        record.update(get_resource_usage_fields("encoding", result.encoding_usage))
+        record.update(get_resource_usage_fields("scoring", result.scoring_usage))
+        record.update(get_benchmark_fields(result))
+
+        return record
+
+    def record(self, result: SweepResult, frame_data: FrameData) -> None:
+        record = self.get_record(result, frame_data)
+
+        self._jsonl_file.write(f"{json.dumps(record)}\n")
+        self._jsonl_file.flush()
+
+        self._csv_writer.writerow(
+            {field: "" if value is None else value for field, value in record.items()}
+        )
+        self._csv_file.flush()
+
+    def close(self) -> None:
+        self._jsonl_file.close()
+        self._csv_file.close()
@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from dataclasses import dataclass
+import os
+from queue import Queue
+from threading import BoundedSemaphore, Thread
+from typing import Callable, Dict, Iterator, List, Optional
+
+from reference_cache import ReferenceVideo
+from result_cache import ResultCache
+from sweep import (
+    encode_job,
+    run_job,
+    score_job,
+    score_jobs_batch,
+    SweepJob,
+    SweepResult,
+)
+from utils import Logger
+
+log = Logger("scheduler")
+
+
+@dataclass
+class CoreBudget:
+    encoder_threads: Optional[int]
+    vmaf_threads: str
+
+
+def get_core_budget(jobs: int, args) -> CoreBudget:
+    """
+    Divide the available cores between the jobs that run concurrently.
+    Each job transcodes and then calculates the metrics, so both stages may use all of the job's cores.
+    """
+    if jobs == 1:
+        return CoreBudget(args.encoder_threads, args.n_threads)
+
+    cores_per_job = max(1, (os.cpu_count() or 1) // jobs)
+
+    return CoreBudget(
+        encoder_threads=args.encoder_threads or cores_per_job,
+        vmaf_threads=str(min(int(args.n_threads), cores_per_job)),
+    )
+
+
+def run_jobs_pipelined(
+    jobs: List[SweepJob], video_path: str, reference: ReferenceVideo, args
+) -> Iterator[SweepResult]:
+    """
+    Transcode the next job while the previous job's metrics are being calculated.
+    At most args.max_pending_encodes transcoded files wait to be scored at any one time.
+    """
+    # One slot for the file that is being scored, the rest for the files waiting to be scored.
+    slots = BoundedSemaphore(args.max_pending_encodes + 1)
+    encoded = Queue()
+
+    def encode_jobs() -> None:
+        for job in jobs:
+            slots.acquire()
+            try:
+                encoded.put((job, encode_job(job, video_path, args), None))
+            except BaseException as error:
+                encoded.put((job, None, error))
+                return
+
+    encoder_thread = Thread(target=encode_jobs, daemon=True)
+    encoder_thread.start()
+
+    for _ in jobs:
+        job, encoding_time, error = encoded.get()
+        if error is not None:
+            raise error
+
+        try:
+            result = score_job(job, video_path, reference, args, encoding_time)
+        finally:
+            slots.release()
+
+        yield result
+
+    encoder_thread.join()
+
+
+def run_jobs_batch(
+    jobs: List[SweepJob], video_path: str, reference: ReferenceVideo, args
+) -> Iterator[SweepResult]:
+    """Transcode every job, then score all of the transcodes against one decode of the reference."""
+    encoding_times = [encode_job(job, video_path, args) for job in jobs]
+    yield from score_jobs_batch(jobs, video_path, reference, args, encoding_times)
+
+
+def run_uncached_jobs(
+    jobs: List[SweepJob], video_path: str, reference: ReferenceVideo, args
+) -> Iterator[SweepResult]:
+    num_workers = min(args.jobs, len(jobs))
+    # When pipelining, the encoder and libvmaf run at the same time, so they share the cores.
+    budget = get_core_budget(2 if args.pipeline else num_workers, args)
+
+    job_args = copy(args)
+    job_args.encoder_threads = budget.encoder_threads
+    job_args.n_threads = budget.vmaf_threads
+
+    if args.pipeline:
+        log.info(
+            f"Pipelining activated. Up to {args.max_pending_encodes} transcoded file(s) will wait to be scored."
+        )
+        yield from run_jobs_pipelined(jobs, video_path, reference, job_args)
+        return
+
+    if args.batch_scoring:
+        log.info("Batch scoring activated.")
+        yield from run_jobs_batch(jobs, video_path, reference, job_args)
+        return
+
+    if num_workers == 1:
+        for job in jobs:
+            yield run_job(job, video_path, reference, job_args)
+        return
+
+    log.info(
+        f"Running {num_workers} jobs at a time "
+        f"({budget.encoder_threads} encoder threads and {budget.vmaf_threads} libvmaf threads per job)."
+    )
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(run_job, job, video_path, reference, job_args)
+            for job in jobs
+        ]
+
+        for future in futures:
+            yield future.result()
+
+
+def run_jobs(
+    jobs: List[SweepJob],
+    video_path: str,
+    reference: ReferenceVideo,
+    args,
+    result_cache: Optional[ResultCache] = None,
+    completed_results: Optional[Dict[str, SweepResult]] = None,
+    run_uncached: Callable[..., Iterator[SweepResult]] = run_uncached_jobs,
+) -> Iterator[SweepResult]:
+    """
+    Run the jobs and yield their results in the order that the jobs were specified.
+    Jobs with a completed result (from a resumed run) or a cached result are not run again,
+    the rest are run by run_uncached.
+    """
+    completed_results = completed_results or {}
+    cached_results = {}
+
+    for i, job in enumerate(jobs):
+        if job.label in completed_results:
+            cached_results[i] = completed_results[job.label]
+        elif result_cache is not None:
+            result = result_cache.load(job, args)
+            if result is not None:
+                cached_results[i] = result
+
+    uncached_jobs = [job for i, job in enumerate(jobs) if i not in cached_results]
+    uncached_results = (
+        run_uncached(uncached_jobs, video_path, reference, args)
+        if uncached_jobs
+        else iter([])
+    )
+
+    for i, job in enumerate(jobs):
+        if i in cached_results:
+            yield cached_results[i]
+            continue
+
+        result = next(uncached_results)
+        if result_cache is not None:
+            result_cache.store(job, result, args)
+
+        yield result
@@ -0,0 +1,105 @@
+import os
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from ffmpeg_process_factory import LibVmafArguments
+from libvmaf import get_metric_types, get_vmaf_options
+from reference_cache import ReferenceVideo
+from transcode_video import get_encoding_arguments
+from utils import force_decimal_places, line, Logger, Timer
+
+log = Logger("single_pass")
+
+# The size of each read from the encoder's stdout.
+CHUNK_SIZE = 1 << 20
+
+
+class SinglePassError(Exception):
+    pass
+
+
+def transcode_and_run_libvmaf(
+    original_video_path: str,
+    reference: ReferenceVideo,
+    args,
+    value: Optional[str],
+    output_folder: str,
+    log_file_path: Path,
+    description: str,
+    combination: Optional[List[str]] = None,
+) -> Tuple[str, int]:
+    """
+    Stream the encoder's output (Matroska over stdout) straight into libvmaf, without writing it to disk.
+    Returns the time taken and the number of bytes that the encoder produced.
+    """
+    encoding_arguments = get_encoding_arguments(
+        original_video_path, args, value, "pipe:1", combination, "matroska"
+    ).get_arguments()
+
+    libvmaf_arguments = LibVmafArguments(
+        reference.path,
+        "pipe:0",
+        get_vmaf_options(args, log_file_path),
+        reference.video_filters,
+    ).get_arguments()
+
+    line()
+    log.info(
+        f"Transcoding the video using {description} and calculating the "
+        f"{get_metric_types(args)} in a single pass...\n"
+    )
+
+    transcode_log_path = os.path.join(output_folder, "transcode_ffmpeg_log.txt")
+    libvmaf_log_path = os.path.join(output_folder, "libvmaf_ffmpeg_log.txt")
+
+    timer = Timer()
+    timer.start()
+
+    with open(transcode_log_path, "w") as transcode_log, open(
+        libvmaf_log_path, "w"
+    ) as libvmaf_log:
+        encoder = subprocess.Popen(
+            encoding_arguments, stdout=subprocess.PIPE, stderr=transcode_log
+        )
+        scorer = subprocess.Popen(
+            libvmaf_arguments, stdin=subprocess.PIPE, stderr=libvmaf_log
+        )
+
+        bytes_transferred = 0
+        try:
+            while True:
+                chunk = encoder.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                bytes_transferred += len(chunk)
+                scorer.stdin.write(chunk)
+        except BrokenPipeError:
+            # libvmaf exited early, the return codes below tell us why.
+            encoder.kill()
+        finally:
+            encoder.stdout.close()
+            try:
+                scorer.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        encoder.wait()
+        # The encoder finishes when its last byte has been consumed by libvmaf.
+        time_taken = timer.elapsed()
+        scorer.wait()
+
+    if encoder.returncode != 0:
+        raise SinglePassError(
+            f"The encoder failed. Check '{transcode_log_path}' for details."
+        )
+
+    if scorer.returncode != 0:
+        raise SinglePassError(
+            f"libvmaf failed. Check '{libvmaf_log_path}' for details."
+        )
+
+    log.info(f"Time Taken: {force_decimal_places(time_taken, args.decimal_places)}s")
+    log.info(f"Encoded size: {bytes_transferred} bytes (not written to disk)")
+
+    return time_taken, bytes_transferred
@@ -0,0 +1,378 @@
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Optional
+
+from adaptive_scoring import run_libvmaf_adaptive
+from libvmaf import model_file_path, run_libvmaf, run_libvmaf_batch
+from metrics import MetricScores, process_metrics
+from reference_cache import ReferenceVideo
+from single_pass import transcode_and_run_libvmaf
+from transcode_video import (
+    benchmark_transcode,
+    transcode_video,
+    transcode_video_chunked,
+)
+from utils import (
+    force_decimal_places,
+    format_bitrate,
+    ResourceUsage,
+    VideoInfoProvider,
+)
+
+
+@dataclass
+class SweepJob:
+    """A single parameter value or combination to transcode and analyse."""
+
+    label: str
+    output_folder: str
+    output_path: str
+    description: str
+    value: Optional[str] = None
+    combination_list: Optional[List[str]] = None
+
+
+@dataclass
+class EncodingTime:
+    # Seconds
+    time_taken: float
+    # Only measured with --resource-usage or --benchmark-runs, or when encoding in chunks.
+    resource_usage: Optional[ResourceUsage] = None
+    # The resources used by each run with --benchmark-runs.
+    benchmark_runs: Optional[List[ResourceUsage]] = None
+
+
+@dataclass
+class SweepResult:
+    label: str
+    # Seconds
+    time_taken: float
+    size_bytes: int
+    # Bits per second
+    bitrate: float
+    metric_scores: Dict[str, MetricScores]
+    encoding_usage: Optional[ResourceUsage] = None
+    scoring_usage: Optional[ResourceUsage] = None
+    # With --benchmark-runs, time_taken is the median of these runs and encoding_usage is the run that took that time.
+    benchmark_runs: Optional[List[ResourceUsage]] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SweepResult":
+        return cls(
+            data["label"],
+            data["time_taken"],
+            data["size_bytes"],
+            data["bitrate"],
+            {
+                metric_type: MetricScores(**scores)
+                for metric_type, scores in data["metric_scores"].items()
+            },
+            *(
+                ResourceUsage(**data[key]) if data.get(key) else None
+                for key in ("encoding_usage", "scoring_usage")
+            ),
+            get_benchmark_runs(data),
+        )
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @property
+    def vmaf_mean(self) -> float:
+        scores = self.metric_scores.get("VMAF")
+        return float(scores.mean) if scores is not None else 0
+
+    def get_row(
+        self,
+        metrics_list: List[str],
+        decimal_places: int,
+        resource_usage=False,
+        benchmark=False,
+    ) -> List[str]:
+        time_taken = force_decimal_places(self.time_taken, decimal_places)
+        if self.benchmark_runs:
+            time_taken = format_median_and_range(
+                [run.wall_time for run in self.benchmark_runs], decimal_places
+            )
+        if self.encoding_usage is not None:
+            time_taken += f" ({force_decimal_places(self.encoding_usage.cpu_time, decimal_places)} CPU)"
+
+        row = [
+            self.label,
+            time_taken,
+            f"{force_decimal_places(self.size_bytes / 1_000_000, decimal_places)} MB",
+            format_bitrate(self.bitrate, decimal_places),
+        ]
+
+        if benchmark:
+            row.insert(
+                2,
+                (
+                    format_median_and_range(
+                        [run.fps for run in self.benchmark_runs], decimal_places
+                    )
+                    if self.benchmark_runs
+                    else "N/A"
+                ),
+            )
+
+        for metric_type in metrics_list:
+            scores = self.metric_scores.get(metric_type)
+            if scores:
+                row.append(str(scores))
+
+        if resource_usage:
+            for usage in (self.encoding_usage, self.scoring_usage):
+                row.append(usage.format(decimal_places) if usage else "N/A")
+
+        return row
+
+
+def get_benchmark_runs(data: Dict) -> Optional[List[ResourceUsage]]:
+    if not data.get("benchmark_runs"):
+        return None
+
+    return [ResourceUsage(**run) for run in data["benchmark_runs"]]
+
+
+def format_median_and_range(values: List[float], decimal_places: int) -> str:
+    return (
+        f"{force_decimal_places(median(values), decimal_places)} "
+        f"[{force_decimal_places(min(values), decimal_places)}–"
+        f"{force_decimal_places(max(values), decimal_places)}]"
+    )
+
+
+def get_sweep_settings(args) -> Dict:
+    """The arguments that affect the result of every job in the sweep."""
+    return {
+        "encoder": args.encoder,
+        "encoder_options": args.encoder_options,
+        "av1_cpu_used": args.av1_cpu_used if args.encoder == "libaom-av1" else None,
+        "parameter": args.parameter,
+        "video_filters": args.video_filters,
+        "model": model_file_path,
+        "n_subsample": args.n_subsample,
+        "phone_model": args.phone_model,
+        "disable_psnr": args.disable_psnr,
+        "disable_ssim": args.disable_ssim,
+        "encode_chunks": args.encode_chunks,
+        "log_format": args.log_format,
+        "vmaf_tolerance": args.vmaf_tolerance,
+        "transcode_length": args.transcode_length,
+        "interval": args.interval,
+        "clip_length": args.clip_length if args.interval is not None else None,
+        "stratified_clips": (
+            args.stratified_clips if args.interval is not None else None
+        ),
+        # The size of a piped Matroska stream differs slightly from the size of a file.
+        "single_pass": args.single_pass,
+        # Encoding times measured with different benchmark settings are not comparable.
+        "benchmark": (
+            {
+                "runs": args.benchmark_runs,
+                "warmup": args.benchmark_warmup,
+                "cpu_set": args.cpu_set,
+            }
+            if args.benchmark_runs is not None
+            else None
+        ),
+    }
+
+
+def create_parameter_value_job(value: str, output_folder: str, args) -> SweepJob:
+    current_output_folder = os.path.join(output_folder, f"{args.parameter}_{value}")
+
+    return SweepJob(
+        label=value,
+        output_folder=current_output_folder,
+        output_path=os.path.join(current_output_folder, f"{value}.mkv"),
+        description=f"'-{args.parameter} {value}'",
+        value=value,
+    )
+
+
+def create_combination_job(combination: str, output_folder: str) -> SweepJob:
+    current_output_folder = os.path.join(output_folder, combination.replace(" ", "_"))
+
+    combination_list = combination.split(" ")
+
+    for i in range(0, len(combination_list), 2):
+        combination_list[i] = f"-{combination_list[i]}"
+
+    combination_string = " ".join(combination_list)
+
+    return SweepJob(
+        label=combination_string,
+        output_folder=current_output_folder,
+        output_path=os.path.join(
+            current_output_folder, f"{combination.replace(' ', '_')}.mkv"
+        ),
+        description=f"combination '{combination_string}'",
+        combination_list=combination_list,
+    )
+
+
+def create_jobs(output_folder: str, args) -> List[SweepJob]:
+    if args.combinations:
+        return [
+            create_combination_job(combination, output_folder)
+            for combination in args.combinations.split(",")
+        ]
+
+    if args.target_vmaf is not None:
+        # Any value in the range may be tried by the search.
+        low, high = args.range
+        return [
+            create_parameter_value_job(str(value), output_folder, args)
+            for value in range(low, high + 1)
+        ]
+
+    return [
+        create_parameter_value_job(value, output_folder, args) for value in args.values
+    ]
+
+
+def encode_job(job: SweepJob, video_path: str, args) -> EncodingTime:
+    os.makedirs(job.output_folder, exist_ok=True)
+
+    if args.benchmark_runs is not None:
+        transcode = benchmark_transcode
+    elif args.encode_chunks > 1:
+        transcode = transcode_video_chunked
+    else:
+        transcode = transcode_video
+
+    return EncodingTime(
+        *transcode(
+            video_path,
+            args,
+            job.value,
+            job.output_path,
+            f"Transcoding the video using {job.description}",
+            job.combination_list,
+        )
+    )
+
+
+def get_log_file_path(job: SweepJob, args) -> Path:
+    return Path(job.output_folder) / f"per_frame_metrics.{args.log_format}"
+
+
+def score_job(
+    job: SweepJob,
+    video_path: str,
+    reference: ReferenceVideo,
+    args,
+    encoding_time: EncodingTime,
+) -> SweepResult:
+    log_file_path = get_log_file_path(job, args)
+    score = run_libvmaf_adaptive if args.vmaf_tolerance is not None else run_libvmaf
+
+    scoring_usage = score(
+        job.output_path,
+        args,
+        log_file_path,
+        reference,
+        f" achieved with {job.description}",
+    )
+
+    return get_result(
+        job, video_path, log_file_path, args, encoding_time, scoring_usage
+    )
+
+
+def score_jobs_batch(
+    jobs: List[SweepJob],
+    video_path: str,
+    reference: ReferenceVideo,
+    args,
+    encoding_times: List[EncodingTime],
+) -> List[SweepResult]:
+    log_file_paths = [get_log_file_path(job, args) for job in jobs]
+
+    run_libvmaf_batch(
+        [job.output_path for job in jobs], args, log_file_paths, reference
+    )
+
+    return [
+        get_result(job, video_path, log_file_path, args, encoding_time)
+        for job, log_file_path, encoding_time in zip(
+            jobs, log_file_paths, encoding_times
+        )
+    ]
+
+
+def get_result(
+    job: SweepJob,
+    video_path: str,
+    log_file_path: Path,
+    args,
+    encoding_time: EncodingTime,
+    scoring_usage: Optional[ResourceUsage] = None,
+) -> SweepResult:
+    size_bytes = os.path.getsize(job.output_path)
+    # The transcode has the same duration as the video it was created from,
+    # so the bitrate is derived from the size rather than probing the transcode.
+    duration = VideoInfoProvider(video_path).get_duration()
+
+    metric_scores = process_metrics(
+        log_file_path, args, job.output_folder, args.decimal_places
+    )
+
+    return SweepResult(
+        job.label,
+        encoding_time.time_taken,
+        size_bytes,
+        size_bytes * 8 / duration,
+        metric_scores,
+        encoding_time.resource_usage,
+        scoring_usage,
+        encoding_time.benchmark_runs,
+    )
+
+
+def run_single_pass_job(
+    job: SweepJob, video_path: str, reference: ReferenceVideo, args
+) -> SweepResult:
+    os.makedirs(job.output_folder, exist_ok=True)
+    log_file_path = get_log_file_path(job, args)
+
+    time_taken, num_bytes = transcode_and_run_libvmaf(
+        video_path,
+        reference,
+        args,
+        job.value,
+        job.output_folder,
+        log_file_path,
+        job.description,
+        job.combination_list,
+    )
+
+    # The size and bitrate are measured from the bytes that passed through the pipe.
+    duration = VideoInfoProvider(video_path).get_duration()
+
+    metric_scores = process_metrics(
+        log_file_path, args, job.output_folder, args.decimal_places
+    )
+
+    return SweepResult(
+        job.label,
+        time_taken,
+        num_bytes,
+        num_bytes * 8 / duration,
+        metric_scores,
+    )
+
+
+def run_job(
+    job: SweepJob, video_path: str, reference: ReferenceVideo, args
+) -> SweepResult:
+    if args.single_pass:
+        return run_single_pass_job(job, video_path, reference, args)
+
+    return score_job(
+        job, video_path, reference, args, encode_job(job, video_path, args)
+    )
@@ -0,0 +1,104 @@
+import math
+from typing import Dict, Iterator, List, Optional
+
+from reference_cache import ReferenceVideo
+from result_cache import ResultCache
+from scheduler import run_jobs
+from sweep import SweepJob, SweepResult
+from utils import Logger
+
+log = Logger("target_search")
+
+
+def to_linear_scale(vmaf: float) -> float:
+    """
+    VMAF flattens out as it approaches 100, but log(100 - VMAF) changes roughly linearly with parameters such as CRF,
+    so values are interpolated on this scale.
+    """
+    return math.log(max(100 - vmaf, 0.001))
+
+
+def interpolate_value(low: int, high: int, low_error: float, high_error: float) -> int:
+    """Interpolate the value with an error of 0, excluding the values that have already been tried."""
+    if low_error == high_error:
+        return (low + high) // 2
+
+    value = low + low_error * (high - low) / (low_error - high_error)
+    return min(max(round(value), low + 1), high - 1)
+
+
+def search_target_vmaf(
+    jobs: List[SweepJob],
+    video_path: str,
+    reference: ReferenceVideo,
+    args,
+    result_cache: Optional[ResultCache] = None,
+    completed_results: Optional[Dict[str, SweepResult]] = None,
+) -> Iterator[SweepResult]:
+    """
+    Search --range for the value that achieves --target-vmaf, assuming that the VMAF changes monotonically with the value.
+    Both ends of the range are tried first, then the next value is interpolated between the closest values on either side
+    of the target (the Illinois variant of regula falsi), until the two sides are adjacent values.
+    The result of each value that is tried is yielded as soon as it is available.
+    """
+    jobs_by_value = {int(job.value): job for job in jobs}
+    target = to_linear_scale(args.target_vmaf)
+
+    def try_value(value: int) -> SweepResult:
+        (result,) = run_jobs(
+            [jobs_by_value[value]],
+            video_path,
+            reference,
+            args,
+            result_cache,
+            completed_results,
+        )
+        return result
+
+    low, high = args.range
+    low_result = try_value(low)
+    yield low_result
+    high_result = try_value(high)
+    yield high_result
+
+    low_error = to_linear_scale(low_result.vmaf_mean) - target
+    high_error = to_linear_scale(high_result.vmaf_mean) - target
+
+    if low_error * high_error > 0:
+        log.info(
+            f"The target VMAF ({args.target_vmaf}) is not between the VMAF achieved with {low} ({low_result.vmaf_mean}) "
+            f"and {high} ({high_result.vmaf_mean}), so the search has stopped."
+        )
+        return
+
+    moved_side = None
+
+    while high - low > 1:
+        value = interpolate_value(low, high, low_error, high_error)
+        result = try_value(value)
+        yield result
+
+        error = to_linear_scale(result.vmaf_mean) - target
+
+        # If the same side moves twice in a row, halve the error of the other side so that it also moves.
+        if (error > 0) == (low_error > 0):
+            low, low_error = value, error
+            if moved_side == "low":
+                high_error /= 2
+            moved_side = "low"
+        else:
+            high, high_error = value, error
+            if moved_side == "high":
+                low_error /= 2
+            moved_side = "high"
+
+
+def get_target_result(
+    results: List[SweepResult], target: float
+) -> Optional[SweepResult]:
+    """The result with the lowest VMAF that still achieves the target."""
+    return min(
+        (result for result in results if result.vmaf_mean >= target),
+        key=lambda result: result.vmaf_mean,
+        default=None,
+    )
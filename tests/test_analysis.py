@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+
+import numpy as np
+from prettytable import PrettyTable
+
+from analysis import (
+    compare_sweeps,
+    get_bd_difference,
+    get_dominating_indices,
+    mark_pareto_frontier,
+)
+
+
+def make_result(label: str, bitrate: float, vmaf: float, time_taken: float = 1.0):
+    return SimpleNamespace(
+        label=label,
+        bitrate=bitrate,
+        vmaf_mean=vmaf,
+        time_taken=time_taken,
+        metric_scores={"VMAF": None},
+    )
+
+
+def get_pareto_column(results, include_time: bool = True):
+    table = PrettyTable(["Value"])
+    for result in results:
+        table.add_row([result.label])
+
+    mark_pareto_frontier(table, results, include_time)
+
+    return [
+        cell.strip()
+        for cell in table.get_string(
+            fields=["Pareto"], header=False, border=False
+        ).splitlines()
+    ]
+
+
+def test_dominating_indices():
+    costs = np.array(
+        [
+            [1.0, 1.0],
+            # Worse than row 0 in both costs.
+            [2.0, 2.0],
+            # Better than row 0 in one cost and worse in the other.
+            [0.5, 3.0],
+            # Equal to row 0, so neither dominates the other.
+            [1.0, 1.0],
+            # Equal to row 0 in one cost and worse in the other.
+            [1.0, 1.5],
+        ]
+    )
+
+    dominating_indices = get_dominating_indices(costs)
+
+    assert list(dominating_indices[[0, 2, 3]]) == [-1, -1, -1]
+    assert dominating_indices[1] in (0, 3)
+    assert dominating_indices[4] in (0, 3)
+
+
+def test_pareto_column():
+    results = [
+        make_result("20", bitrate=4.0, vmaf=97, time_taken=3.0),
+        make_result("25", bitrate=2.0, vmaf=94, time_taken=2.0),
+        # Higher bitrate and lower VMAF than 25, but faster.
+        make_result("slow", bitrate=3.0, vmaf=93, time_taken=1.0),
+        # Dominated by 25 in every cost.
+        make_result("bad", bitrate=2.5, vmaf=90, time_taken=2.5),
+    ]
+
+    assert get_pareto_column(results) == [
+        "optimal",
+        "optimal",
+        "optimal",
+        "dominated by 25",
+    ]
+    assert get_pareto_column(results, include_time=False) == [
+        "optimal",
+        "optimal",
+        "dominated by 25",
+        "dominated by 25",
+    ]
+
+
+def test_pareto_column_is_not_added_without_results():
+    table = PrettyTable(["Value"])
+
+    mark_pareto_frontier(table, [])
+
+    assert table.field_names == ["Value"]
+
+
+def test_bd_difference_of_shifted_curves():
+    x = np.linspace(0, 3, 6)
+    y = 80 + 5 * x - 0.5 * x**2
+
+    assert np.isclose(get_bd_difference(x, y, x, y), 0)
+    assert np.isclose(get_bd_difference(x, y, x, y + 1.5), 1.5)
+    # A test curve that only covers part of the range of the anchor curve.
+    assert np.isclose(get_bd_difference(x, y, x[2:], y[2:] - 2), -2)
+
+
+def test_bd_difference_without_overlap():
+    x = np.array([0.0, 1.0, 2.0])
+
+    assert get_bd_difference(x, x, x + 2, x) is None
+
+
+def test_bd_rate_of_a_sweep_with_a_lower_bitrate_for_the_same_vmaf():
+    vmafs = [80, 88, 93, 96]
+    anchor_bitrates = [1.0, 2.0, 4.0, 8.0]
+    anchor_results = [
+        make_result(str(i), bitrate, vmaf)
+        for i, (bitrate, vmaf) in enumerate(zip(anchor_bitrates, vmafs))
+    ]
+    results = [
+        make_result(str(i), bitrate * 0.8, vmaf)
+        for i, (bitrate, vmaf) in enumerate(zip(anchor_bitrates, vmafs))
+    ]
+
+    comparison = compare_sweeps(results, anchor_results, "anchor", 2)
+
+    assert "BD-rate: -20.00%" in comparison
+    assert "BD-VMAF: " in comparison
+    assert float(comparison.split("BD-VMAF: ")[1].split()[0]) > 0
+
+
+def test_sweeps_need_two_vmaf_results_to_compare():
+    results = [make_result("0", 1.0, 90)]
+
+    assert "At least two VMAF results" in compare_sweeps(results, results, "anchor", 2)
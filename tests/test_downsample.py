@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from metrics import downsample
+
+
+@pytest.mark.parametrize("max_points", [None, 0, 100, 1000])
+def test_short_videos_are_not_downsampled(max_points):
+    x_values = np.arange(100)
+    y_values = np.linspace(80, 100, 100)
+
+    downsampled_x, downsampled_y = downsample(x_values, y_values, max_points)
+
+    assert downsampled_x is x_values
+    assert downsampled_y is y_values
+
+
+@pytest.mark.parametrize("num_values", [1001, 4096, 100_003])
+# --graph-points must be 0 or at least 4.
+@pytest.mark.parametrize("max_points", [4, 5, 501, 1000])
+def test_downsampled_points_are_within_the_limit(num_values, max_points):
+    x_values = np.arange(num_values)
+    y_values = np.random.default_rng(num_values).uniform(0, 100, num_values)
+
+    downsampled_x, downsampled_y = downsample(x_values, y_values, max_points)
+
+    assert len(downsampled_x) <= max_points
+    # The points are a subset of the original points, in order, and include the first and last frames.
+    assert np.all(np.diff(downsampled_x) > 0)
+    np.testing.assert_array_equal(y_values[downsampled_x], downsampled_y)
+    assert downsampled_x[0] == 0
+    assert downsampled_x[-1] == num_values - 1
+
+
+def test_short_dips_are_kept():
+    y_values = np.full(10_000, 95.0)
+    y_values[1234] = 20.0
+    y_values[8765] = 99.0
+
+    downsampled_x, downsampled_y = downsample(np.arange(10_000), y_values, 100)
+
+    assert downsampled_y.min() == 20.0
+    assert downsampled_y.max() == 99.0
+    assert 1234 in downsampled_x
+    assert 8765 in downsampled_x
@@ -0,0 +1,145 @@
+import json
+
+import numpy as np
+import pytest
+
+from metrics import (
+    FrameData,
+    iter_csv_frames,
+    iter_json_frames,
+    iter_xml_frames,
+    load_frame_data,
+    write_frame_log,
+)
+
+METRIC_KEYS = ["vmaf", "psnr_y"]
+
+# The layout of libvmaf's JSON log, with one key per line and the pooled metrics after the frames.
+LIBVMAF_JSON_LOG = """{
+  "version": "3.0.0",
+  "fps": 120.50,
+  "frames": [
+    {
+      "frameNum": 0,
+      "metrics": {
+        "integer_motion2": 0.000000,
+        "psnr_y": 34.760779,
+        "vmaf": 95.123456
+      }
+    },
+    {
+      "frameNum": 1,
+      "metrics": {
+        "integer_motion2": 1.250000,
+        "psnr_y": 33.500000,
+        "vmaf": 90.000000
+      }
+    }
+  ],
+  "pooled_metrics": {
+    "vmaf": {
+      "min": 90.000000,
+      "max": 95.123456,
+      "mean": 92.561728
+    }
+  }
+}
+"""
+
+
+def make_frame_data(num_frames: int) -> FrameData:
+    frame_numbers = np.arange(num_frames)
+    return FrameData.from_arrays(
+        frame_numbers,
+        {
+            "vmaf": 90 + (frame_numbers % 10) / 4,
+            "psnr_y": 40 - (frame_numbers % 7) / 8,
+        },
+    )
+
+
+def test_iter_json_frames_reads_libvmaf_log(tmp_path):
+    log_file_path = tmp_path / "log.json"
+    log_file_path.write_text(LIBVMAF_JSON_LOG)
+
+    assert list(iter_json_frames(str(log_file_path), METRIC_KEYS)) == [
+        (0, {"psnr_y": 34.760779, "vmaf": 95.123456}),
+        (1, {"psnr_y": 33.5, "vmaf": 90.0}),
+    ]
+
+
+def test_iter_json_frames_falls_back_to_json_module(tmp_path):
+    log_file_path = tmp_path / "log.json"
+    # With a space before each colon, the keys are not found by the pattern, so the file is loaded with json.
+    log_file_path.write_text(
+        json.dumps(
+            {"frames": [{"frameNum": 3, "metrics": {"vmaf": 80.5}}]},
+            separators=(",", " : "),
+        )
+    )
+
+    assert list(iter_json_frames(str(log_file_path), ["vmaf"])) == [(3, {"vmaf": 80.5})]
+
+
+def test_iter_json_frames_reads_across_chunks(tmp_path):
+    # Long enough to be read in several chunks.
+    frame_data = make_frame_data(20_000)
+    log_file_path = tmp_path / "log.json"
+    write_frame_log(frame_data, str(log_file_path))
+    assert log_file_path.stat().st_size > 2 << 20
+
+    frames = list(iter_json_frames(str(log_file_path), METRIC_KEYS))
+
+    assert [frame_number for frame_number, _ in frames] == list(range(20_000))
+    assert [scores["vmaf"] for _, scores in frames] == list(
+        frame_data.get_scores("vmaf")
+    )
+
+
+def test_iter_csv_frames_skips_missing_and_invalid_scores(tmp_path):
+    log_file_path = tmp_path / "log.csv"
+    log_file_path.write_text(
+        "Frame,integer_motion2,vmaf\n0,0.0,95.5\n1,1.5,nan-ish\n\n2,2.0,90\n"
+    )
+
+    assert list(iter_csv_frames(str(log_file_path), METRIC_KEYS)) == [
+        (0, {"vmaf": 95.5}),
+        (1, {}),
+        (2, {"vmaf": 90.0}),
+    ]
+
+
+def test_iter_xml_frames_reads_frame_attributes(tmp_path):
+    log_file_path = tmp_path / "log.xml"
+    log_file_path.write_text(
+        '<VMAF version="3.0.0"><frames>'
+        '<frame frameNum="0" psnr_y="34.5" vmaf="95.5" />'
+        '<frame frameNum="1" vmaf="90" />'
+        "</frames>"
+        '<pooled_metrics><metric name="vmaf" mean="92.75" /></pooled_metrics></VMAF>'
+    )
+
+    assert list(iter_xml_frames(str(log_file_path), METRIC_KEYS)) == [
+        (0, {"vmaf": 95.5, "psnr_y": 34.5}),
+        (1, {"vmaf": 90.0}),
+    ]
+
+
+@pytest.mark.parametrize("extension", [".json", ".csv", ".xml"])
+def test_written_logs_are_loaded_unchanged(tmp_path, extension):
+    frame_data = make_frame_data(100)
+    log_file_path = str(tmp_path / f"log{extension}")
+
+    write_frame_log(frame_data, log_file_path)
+    loaded = load_frame_data(log_file_path, METRIC_KEYS)
+
+    np.testing.assert_array_equal(loaded.frame_numbers, frame_data.frame_numbers)
+    for key in METRIC_KEYS:
+        np.testing.assert_allclose(loaded.get_scores(key), frame_data.get_scores(key))
+
+
+def test_unparsable_log_gives_no_frames(tmp_path):
+    log_file_path = tmp_path / "log.xml"
+    log_file_path.write_text('<VMAF><frames><frame frameNum="0" vmaf="1"')
+
+    assert len(load_frame_data(str(log_file_path), METRIC_KEYS)) == 0
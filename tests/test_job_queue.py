@@ -0,0 +1,133 @@
+import argparse
+from types import SimpleNamespace
+
+import pytest
+
+import job_queue
+from job_queue import claim_job, connect, enqueue_jobs, MAX_ATTEMPTS, run_claimed_job
+from reference_cache import ReferenceVideo
+from sweep import SweepJob
+
+LEASE = 60
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the time used by the queue with a clock that only moves when the test advances it."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(job_queue.time, "time", lambda: clock.now)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue_path = str(tmp_path / "queue.db")
+    connection = connect(queue_path)
+    jobs = [
+        SweepJob(
+            label,
+            str(tmp_path / "sweep" / label),
+            str(tmp_path / "sweep" / label / "output.mp4"),
+            f"'-crf {label}'",
+            label,
+        )
+        for label in ("20", "30")
+    ]
+    job_ids = enqueue_jobs(
+        connection,
+        str(tmp_path / "sweep"),
+        jobs,
+        "input.mp4",
+        ReferenceVideo("input.mp4"),
+        argparse.Namespace(parameter="crf"),
+    )
+
+    yield SimpleNamespace(path=queue_path, connection=connection, job_ids=job_ids)
+    connection.close()
+
+
+def get_job(connection, job_id):
+    return connection.execute(
+        "SELECT state, attempts, worker FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+
+
+def test_jobs_are_claimed_once_in_order(queue):
+    first_id, second_id = queue.job_ids
+
+    first = claim_job(queue.connection, "a", LEASE)
+    second = claim_job(queue.connection, "b", LEASE)
+
+    assert first[0] == first_id
+    assert first[1]["job"]["label"] == "20"
+    assert second[0] == second_id
+    assert claim_job(queue.connection, "c", LEASE) is None
+    assert get_job(queue.connection, first_id) == ("running", 1, "a")
+    assert get_job(queue.connection, second_id) == ("running", 1, "b")
+
+
+def test_job_is_claimed_again_once_its_lease_expires(queue, clock):
+    job_id, _ = queue.job_ids
+    claim_job(queue.connection, "a", LEASE)
+    claim_job(queue.connection, "b", LEASE)
+
+    clock.now += LEASE - 1
+    assert claim_job(queue.connection, "c", LEASE) is None
+
+    clock.now += 2
+    assert claim_job(queue.connection, "c", LEASE)[0] == job_id
+    assert get_job(queue.connection, job_id) == ("running", 2, "c")
+
+
+def test_job_fails_once_its_lease_expires_on_the_last_attempt(queue, clock):
+    job_id, other_job_id = queue.job_ids
+    # Finish the other job, so that it is not claimed instead.
+    queue.connection.execute(
+        "UPDATE jobs SET state = 'done' WHERE id = ?", (other_job_id,)
+    )
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        assert claim_job(queue.connection, f"worker {attempt}", LEASE)[0] == job_id
+        clock.now += LEASE + 1
+
+    assert claim_job(queue.connection, "another worker", LEASE) is None
+    assert get_job(queue.connection, job_id)[:2] == ("failed", MAX_ATTEMPTS)
+
+
+def test_failed_job_is_retried_until_the_last_attempt(queue, monkeypatch):
+    job_id, other_job_id = queue.job_ids
+    queue.connection.execute(
+        "UPDATE jobs SET state = 'done' WHERE id = ?", (other_job_id,)
+    )
+
+    def run_job(*_):
+        raise RuntimeError("The encoder crashed.")
+
+    monkeypatch.setattr(job_queue, "run_job", run_job)
+
+    for _ in range(MAX_ATTEMPTS):
+        claimed_id, payload = claim_job(queue.connection, "a", LEASE)
+        assert claimed_id == job_id
+        run_claimed_job(queue.connection, queue.path, job_id, payload, "a", LEASE)
+
+    assert claim_job(queue.connection, "a", LEASE) is None
+    state, attempts, error = queue.connection.execute(
+        "SELECT state, attempts, error FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    assert (state, attempts) == ("failed", MAX_ATTEMPTS)
+    assert "The encoder crashed." in error
+
+
+def test_result_is_ignored_once_the_lease_is_lost(queue, clock, monkeypatch):
+    job_id, _ = queue.job_ids
+    _, payload = claim_job(queue.connection, "a", LEASE)
+    claim_job(queue.connection, "b", LEASE)
+    clock.now += LEASE + 1
+    assert claim_job(queue.connection, "c", LEASE)[0] == job_id
+
+    monkeypatch.setattr(
+        job_queue, "run_job", lambda *_: SimpleNamespace(to_dict=lambda: {})
+    )
+    run_claimed_job(queue.connection, queue.path, job_id, payload, "a", LEASE)
+
+    assert get_job(queue.connection, job_id) == ("running", 2, "c")
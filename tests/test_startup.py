@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Only needed once FFmpeg is run, and slow to import.
+SLOW_MODULES = ["requests", "rich", "better_ffmpeg_progress", "matplotlib"]
+
+
+def get_imported_modules(module: str):
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPOSITORY_FOLDER,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    # Each line is "import time: <self> | <cumulative> | <indented module name>".
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in output.splitlines()
+        if line.startswith("import time:") and line.count("|") == 2
+    }
+
+
+def test_slow_modules_are_not_imported_at_startup():
+    imported_modules = get_imported_modules("main")
+
+    assert "main" in imported_modules
+    for module in SLOW_MODULES:
+        assert module not in imported_modules
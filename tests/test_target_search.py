@@ -0,0 +1,77 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+
+import target_search
+from target_search import get_target_result, search_target_vmaf
+
+
+def crf_vmaf(value: int) -> float:
+    """A VMAF that decreases with the value, and flattens out as it approaches 100, like CRF."""
+    return 100 - 0.5 * math.exp(0.1 * value)
+
+
+def bitrate_vmaf(value: int) -> float:
+    """A VMAF that increases with the value, like a bitrate."""
+    return 100 - 400 / math.sqrt(value)
+
+
+@pytest.fixture
+def tried_values(monkeypatch):
+    """Stub out the transcoding and scoring, and record the values that are tried."""
+    tried_values = []
+
+    def run_jobs(jobs, *_):
+        (job,) = jobs
+        tried_values.append(job.value)
+        yield SimpleNamespace(value=job.value, vmaf_mean=job.get_vmaf(job.value))
+
+    monkeypatch.setattr(target_search, "run_jobs", run_jobs)
+    return tried_values
+
+
+def search(get_vmaf, low: int, high: int, target_vmaf: float):
+    jobs = [
+        SimpleNamespace(value=str(value), get_vmaf=lambda value: get_vmaf(int(value)))
+        for value in range(low, high + 1)
+    ]
+    args = SimpleNamespace(range=(low, high), target_vmaf=target_vmaf)
+
+    return list(search_target_vmaf(jobs, "input.mp4", None, args))
+
+
+@pytest.mark.parametrize(
+    "get_vmaf, low, high",
+    [(crf_vmaf, 0, 51), (crf_vmaf, 10, 40), (bitrate_vmaf, 100, 20_000)],
+)
+@pytest.mark.parametrize("target_vmaf", [80, 93, 95.5, 97])
+def test_search_finds_the_adjacent_values_either_side_of_the_target(
+    tried_values, get_vmaf, low, high, target_vmaf
+):
+    values = range(low, high + 1)
+
+    results = search(get_vmaf, low, high, target_vmaf)
+
+    tried = sorted(int(value) for value in tried_values)
+    assert len(tried) == len(set(tried))
+    # No more values are tried than a bisection of the range would need, after trying both ends.
+    assert len(tried) <= math.ceil(math.log2(high - low)) + 2
+
+    # The value with the lowest VMAF that achieves the target, and its neighbour that does not.
+    closest = min(
+        (value for value in values if get_vmaf(value) >= target_vmaf), key=get_vmaf
+    )
+    assert closest in tried
+    for neighbour in (closest - 1, closest + 1):
+        if low <= neighbour <= high and get_vmaf(neighbour) < target_vmaf:
+            assert neighbour in tried
+
+    assert int(get_target_result(results, target_vmaf).value) == closest
+
+
+def test_search_stops_when_the_target_is_outside_the_range(tried_values):
+    results = search(crf_vmaf, 20, 40, 99.9)
+
+    assert tried_values == ["20", "40"]
+    assert get_target_result(results, 99.9) is None
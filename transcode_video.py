@@ -1,39 +1,287 @@
-from ffmpeg_process_factory import EncodingArguments, EncoderOptions
-from utils import line, Logger, Timer
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from dataclasses import replace
+import os
+from pathlib import Path
+from statistics import median
+from typing import List, Optional, Tuple
 
-from better_ffmpeg_progress import FfmpegProcess
+from ffmpeg_process_factory import EncodingArguments, EncoderOptions
+from utils import (
+    combine_resource_usage,
+    force_decimal_places,
+    line,
+    Logger,
+    parse_cpu_set,
+    ResourceUsage,
+    run_ffmpeg,
+    run_process,
+    Timer,
+    VideoInfoProvider,
+)
 
 log = Logger("transcode_video.py")
 
 
-def transcode_video(
-    original_video_path, args, value, output_path, message, combination=None
+def get_encoding_arguments(
+    original_video_path,
+    args,
+    value,
+    output_path,
+    combination=None,
+    output_format=None,
+    start_time=None,
+    duration=None,
 ):
     encoder_opts = EncoderOptions(
         encoder=args.encoder,
         options=args.encoder_options,
         av1_cpu_used=args.av1_cpu_used,
+        threads=args.encoder_threads,
     )
 
-    encoding_args = EncodingArguments(
+    return EncodingArguments(
         original_video_path,
         encoder_opts,
         output_path,
         args.parameter,
         value,
         combination,
+        output_format,
+        start_time,
+        duration,
     )
 
-    process = FfmpegProcess(
-        encoding_args.get_arguments(), print_detected_duration=False
+
+def transcode_video(
+    original_video_path, args, value, output_path, message, combination=None
+) -> Tuple[float, Optional[ResourceUsage]]:
+    encoding_args = get_encoding_arguments(
+        original_video_path, args, value, output_path, combination
     )
 
     line()
     log.info(f"{message}...\n")
     timer = Timer()
     timer.start()
-    process.run()
-    time_taken = timer.stop(args.decimal_places)
-    print(f"Time Taken: {time_taken}s")
+    resource_usage = run_ffmpeg(
+        encoding_args.get_arguments(),
+        Path(output_path).parent / "transcode_ffmpeg_log.txt",
+        args,
+    )
+    time_taken = timer.elapsed()
+    print(f"Time Taken: {force_decimal_places(time_taken, args.decimal_places)}s")
     log.info(f"Output file: {output_path}")
-    return time_taken
+    return time_taken, resource_usage
+
+
+def benchmark_transcode(
+    original_video_path, args, value, output_path, message, combination=None
+) -> Tuple[float, ResourceUsage, List[ResourceUsage]]:
+    """
+    Encode the video args.benchmark_runs times, after a warm-up run that is discarded if args.benchmark_warmup is set,
+    optionally pinned to the CPUs in args.cpu_set. The output of the last run is kept to be scored.
+    Return the median time taken, the resources used by the run that took the median time and those used by every run.
+    """
+    encoding_args = get_encoding_arguments(
+        original_video_path, args, value, output_path, combination
+    )
+    cpu_set = parse_cpu_set(args.cpu_set) if args.cpu_set else None
+    log_file_path = Path(output_path).parent / "transcode_ffmpeg_log.txt"
+
+    line()
+    log.info(
+        f"{message} {args.benchmark_runs} time(s)"
+        f"{' after a warm-up run' if args.benchmark_warmup else ''}"
+        f"{f' on CPU(s) {args.cpu_set}' if cpu_set else ''}...\n"
+    )
+
+    run_usages = []
+    first_run = 0 if args.benchmark_warmup else 1
+
+    for run_number in range(first_run, args.benchmark_runs + 1):
+        usage = run_process(
+            encoding_args.get_arguments(), log_file_path, cpu_set=cpu_set
+        )
+        print(
+            f"{'Warm-up run' if run_number == 0 else f'Run {run_number}'}: "
+            f"{force_decimal_places(usage.wall_time, args.decimal_places)}s, "
+            f"{force_decimal_places(usage.fps, args.decimal_places)} FPS"
+            f"{' (discarded)' if run_number == 0 else ''}"
+        )
+
+        if run_number > 0:
+            run_usages.append(usage)
+
+    time_taken = median(usage.wall_time for usage in run_usages)
+    median_usage = min(run_usages, key=lambda usage: abs(usage.wall_time - time_taken))
+
+    print(
+        f"Median Time Taken: {force_decimal_places(time_taken, args.decimal_places)}s"
+    )
+    log.info(f"Output file: {output_path}")
+
+    return time_taken, median_usage, run_usages
+
+
+def get_chunk_start_times(
+    keyframe_times: List[float], duration: float, num_chunks: int
+) -> List[float]:
+    """
+    Split the video at the keyframes closest to num_chunks - 1 evenly spaced points.
+    Fewer chunks are returned if the video does not have enough keyframes,
+    and only one if no keyframes were found, as some containers do not flag them.
+    """
+    start_times = [0.0]
+
+    if not keyframe_times:
+        return start_times
+
+    for i in range(1, num_chunks):
+        target = i * duration / num_chunks
+        keyframe_time = min(keyframe_times, key=lambda time: abs(time - target))
+
+        if start_times[-1] < keyframe_time < duration:
+            start_times.append(keyframe_time)
+
+    return start_times
+
+
+def concatenate_chunks(chunk_paths, original_video_path, output_path, log_file_path):
+    """
+    Join the encoded chunks without re-encoding them,
+    adding the audio and subtitle streams of the original video as they would be in a normal transcode.
+    """
+    # The script is read from stdin, so relative paths and paths containing a colon would not resolve.
+    escaped_chunk_paths = [
+        f"file:{os.path.abspath(chunk_path)}".replace("'", "'\\''")
+        for chunk_path in chunk_paths
+    ]
+    concat_list = "".join(f"file '{path}'\n" for path in escaped_chunk_paths)
+
+    return run_process(
+        [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-protocol_whitelist",
+            "file,pipe",
+            "-i",
+            "pipe:0",
+            "-i",
+            str(original_video_path),
+            "-map",
+            "0:V",
+            "-map",
+            "1",
+            "-map",
+            "-1:V",
+            "-c",
+            "copy",
+            str(output_path),
+        ],
+        log_file_path,
+        concat_list.encode(),
+    )
+
+
+def transcode_video_chunked(
+    original_video_path, args, value, output_path, message, combination=None
+) -> Tuple[float, Optional[ResourceUsage]]:
+    """
+    Split the video into args.encode_chunks chunks at keyframes, encode the chunks in parallel FFmpeg processes
+    and join them. Return the time taken and the resources used by all of the processes.
+    """
+    video_info = VideoInfoProvider(original_video_path)
+    duration = video_info.get_duration()
+    # -ss and -t are relative to the start of the video.
+    keyframe_times = [
+        time - video_info.get_start_time() for time in video_info.get_keyframe_times()
+    ]
+    start_times = get_chunk_start_times(keyframe_times, duration, args.encode_chunks)
+    # Seeking half a frame after a keyframe lands on that keyframe, however its timestamp is rounded,
+    # and ending half a frame before the next keyframe never includes that keyframe.
+    half_frame = 0.5 / video_info.get_framerate_float()
+
+    output_path = Path(output_path)
+    num_chunks = len(start_times)
+    chunk_paths = [
+        output_path.with_name(f"{output_path.stem}_chunk{i}{output_path.suffix}")
+        for i in range(num_chunks)
+    ]
+
+    chunk_args = copy(args)
+    # Share the encoder's threads between the chunks. With --jobs, args.encoder_threads is already the job's share
+    # of the CPU cores, so the chunks of every job together use no more threads than there are cores.
+    chunk_args.encoder_threads = max(
+        1, (args.encoder_threads or os.cpu_count() or 1) // num_chunks
+    )
+
+    def encode_chunk(i: int) -> Optional[ResourceUsage]:
+        encoding_args = get_encoding_arguments(
+            original_video_path,
+            chunk_args,
+            value,
+            chunk_paths[i],
+            combination,
+            start_time=start_times[i] + half_frame if i > 0 else None,
+            duration=(
+                start_times[i + 1] - start_times[i] - half_frame
+                if i < num_chunks - 1
+                else None
+            ),
+        )
+
+        return run_process(
+            encoding_args.get_arguments(),
+            output_path.parent / f"transcode_ffmpeg_log_chunk{i}.txt",
+        )
+
+    line()
+    if num_chunks < args.encode_chunks:
+        log.info(
+            f"The video only has enough keyframes to be split into {num_chunks} chunk(s)."
+        )
+    log.info(f"{message} in {num_chunks} chunk(s), in parallel...\n")
+    timer = Timer()
+    timer.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_chunks) as executor:
+            chunk_usages = list(executor.map(encode_chunk, range(num_chunks)))
+
+        chunks_usage = combine_resource_usage(
+            chunk_usages, timer.elapsed(), concurrent=True
+        )
+        concat_usage = concatenate_chunks(
+            chunk_paths,
+            original_video_path,
+            output_path,
+            output_path.parent / "transcode_ffmpeg_log.txt",
+        )
+
+        time_taken = timer.elapsed()
+    finally:
+        # Remove the chunks even if one of them could not be encoded or they could not be joined.
+        for chunk_path in chunk_paths:
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+
+    # The frames were counted when they were encoded, not when they were joined.
+    resource_usage = combine_resource_usage(
+        [chunks_usage, replace(concat_usage, frames=0) if concat_usage else None],
+        time_taken,
+        concurrent=False,
+    )
+
+    print(f"Time Taken: {force_decimal_places(time_taken, args.decimal_places)}s")
+    if resource_usage is not None:
+        print(
+            f"CPU Time: {force_decimal_places(resource_usage.cpu_time, args.decimal_places)}s"
+        )
+    log.info(f"Output file: {output_path}")
+
+    return time_taken, resource_usage
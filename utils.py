@@ -1,12 +1,18 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 import logging
+import multiprocessing
 import numpy as np
 import os
 from pathlib import Path
+import re
+import shutil
+import subprocess
 import sys
 from time import time
+from typing import Dict, List, Optional, Set
 
 from ffmpeg import probe
-import matplotlib.pyplot as plt
 
 
 class Logger:
@@ -51,31 +57,84 @@ class Timer:
     def start(self):
         self._start_time = time()
 
+    def elapsed(self) -> float:
+        """The number of seconds since the timer was started, without rounding."""
+        return time() - self._start_time
+
     def stop(self, decimal_places):
-        time_to_convert = time() - self._start_time
+        time_to_convert = self.elapsed()
         time_rounded = force_decimal_places(
             round(time_to_convert, decimal_places), decimal_places
         )
         return time_rounded
 
 
+class GraphRenderer:
+    """Plots graphs in background processes, so that the sweep does not wait for each graph to be saved."""
+
+    def __init__(self, max_workers=1):
+        # Spawn rather than fork the workers, as they may be started while the pipeline's encoder thread is running.
+        self._executor = ProcessPoolExecutor(
+            max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._futures = []
+
+    def plot_graph(self, *args, **kwargs):
+        self._futures.append(self._executor.submit(plot_graph, *args, **kwargs))
+
+    def join(self):
+        """Wait for every graph to be saved."""
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown()
+
+
+# The ffprobe output for each file, so that a file is only probed once per process.
+_probe_results = {}
+
+
+def get_file_identity(path) -> Dict:
+    """
+    Identify a file by its absolute path, size and modification time, so that a file which is overwritten
+    is not mistaken for the original. Paths that are not local files, such as URLs, are identified by the path alone.
+    """
+    if not os.path.isfile(path):
+        return {"path": str(path)}
+
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def probe_video(video_path):
+    key = tuple(get_file_identity(video_path).values())
+
+    if key not in _probe_results:
+        _probe_results[key] = probe(video_path)
+
+    return _probe_results[key]
+
+
 class VideoInfoProvider:
     def __init__(self, video_path):
         self._video_path = video_path
 
+    def get_bitrate_bps(self, video_path=None):
+        bitrate = probe_video(video_path or self._video_path)["format"]["bit_rate"]
+        return int(bitrate)
+
     def get_bitrate(self, decimal_places, video_path=None):
-        if video_path:
-            bitrate = probe(video_path)["format"]["bit_rate"]
-        else:
-            bitrate = probe(self._video_path)["format"]["bit_rate"]
-        return (
-            f"{force_decimal_places((int(bitrate) / 1_000_000), decimal_places)} Mbps"
-        )
+        return format_bitrate(self.get_bitrate_bps(video_path), decimal_places)
 
     def get_framerate_fraction(self):
         r_frame_rate = [
             stream
-            for stream in probe(self._video_path)["streams"]
+            for stream in probe_video(self._video_path)["streams"]
             if stream["codec_type"] == "video"
         ][0]["r_frame_rate"]
         return r_frame_rate
@@ -85,7 +144,24 @@ class VideoInfoProvider:
         return int(numerator) / int(denominator)
 
     def get_duration(self):
-        return float(probe(self._video_path)["format"]["duration"])
+        return float(probe_video(self._video_path)["format"]["duration"])
+
+    def get_start_time(self):
+        return float(probe_video(self._video_path)["format"].get("start_time", 0))
+
+    def get_keyframe_times(self):
+        """The timestamps of the video's keyframes in seconds, read from the packets without decoding the video."""
+        packets = probe(
+            self._video_path,
+            select_streams="V:0",
+            show_entries="packet=pts_time,flags",
+        )["packets"]
+
+        return sorted(
+            float(packet["pts_time"])
+            for packet in packets
+            if "K" in packet.get("flags", "") and "pts_time" in packet
+        )
 
 
 log = Logger("utils")
@@ -101,7 +177,7 @@ def cut_video(filename, args, output_ext, output_folder, comparison_table):
     # Create the cut version.
     log.info(f"Cutting the video to a length of {args.transcode_length} seconds...")
     os.system(
-        f"ffmpeg -loglevel debug -y -i {args.original_video_path} -t {args.transcode_length} "
+        f'ffmpeg -loglevel debug -y -i "{args.input_video}" -t {args.transcode_length} '
         f'-map 0 -c copy "{output_file_path}"'
     )
     log.info("Done!")
@@ -118,6 +194,158 @@ def cut_video(filename, args, output_ext, output_folder, comparison_table):
     return output_file_path
 
 
+@dataclass
+class ResourceUsage:
+    """The resources used by one or more FFmpeg processes."""
+
+    # Seconds
+    wall_time: float
+    user_time: float
+    system_time: float
+    # Bytes
+    peak_rss: int
+    frames: int
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.system_time
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.wall_time if self.wall_time else 0
+
+    def format(self, decimal_places: int) -> str:
+        return " | ".join(
+            [
+                force_decimal_places(self.user_time, decimal_places),
+                force_decimal_places(self.system_time, decimal_places),
+                f"{force_decimal_places(self.peak_rss / 1_000_000, decimal_places)} MB",
+                force_decimal_places(self.fps, decimal_places),
+            ]
+        )
+
+
+def combine_resource_usage(
+    usages: List[Optional[ResourceUsage]], wall_time: float, concurrent: bool
+) -> Optional[ResourceUsage]:
+    """
+    Combine the resource usage of several processes that took wall_time seconds in total.
+    If the processes ran at the same time, their peak RSS is summed, as they were all in memory at once.
+    """
+    if not usages or None in usages:
+        return None
+
+    peak_rss = [usage.peak_rss for usage in usages]
+
+    return ResourceUsage(
+        wall_time,
+        sum(usage.user_time for usage in usages),
+        sum(usage.system_time for usage in usages),
+        sum(peak_rss) if concurrent else max(peak_rss),
+        sum(usage.frames for usage in usages),
+    )
+
+
+def get_frame_count(ffmpeg_log_file_path) -> int:
+    """The number of frames that FFmpeg output, according to the last progress line of its log."""
+    with open(ffmpeg_log_file_path, "r", errors="replace") as f:
+        frame_counts = re.findall(r"frame=\s*(\d+)", f.read())
+
+    return int(frame_counts[-1]) if frame_counts else 0
+
+
+def parse_cpu_set(cpu_set: str) -> Set[int]:
+    """Parse a list of CPUs in the format used by taskset -c, e.g. "0-3,8"."""
+    cpus = set()
+
+    for cpu_range in cpu_set.split(","):
+        first, _, last = cpu_range.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+
+    return cpus
+
+
+def get_peak_rss(resource_usage) -> int:
+    """The peak RSS in bytes from the result of os.wait4 or resource.getrusage."""
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return resource_usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def run_process(
+    arguments, log_file_path, input=None, cpu_set: Optional[Set[int]] = None
+) -> Optional[ResourceUsage]:
+    """
+    Run a process to completion, writing its output to log_file_path.
+    If cpu_set is specified, the process and every thread it creates can only run on those CPUs.
+    Return the resources used by the process and its children, or None if they cannot be measured on this platform.
+    """
+    start_time = time()
+
+    with open(log_file_path, "w") as log_file:
+        process = subprocess.Popen(
+            arguments,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            # Set in the child before FFmpeg starts, as the affinity of a running process only applies to its main thread.
+            preexec_fn=(
+                (lambda: os.sched_setaffinity(0, cpu_set))
+                if cpu_set is not None
+                else None
+            ),
+        )
+
+        if input is not None:
+            process.stdin.write(input)
+            process.stdin.close()
+
+        resource_usage = None
+        # Unlike the RUSAGE_CHILDREN totals, os.wait4 measures this process alone,
+        # even when other processes are running at the same time.
+        if hasattr(os, "wait4"):
+            _, status, resource_usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        else:
+            process.wait()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, arguments)
+
+    if resource_usage is None:
+        return None
+
+    return ResourceUsage(
+        time() - start_time,
+        resource_usage.ru_utime,
+        resource_usage.ru_stime,
+        get_peak_rss(resource_usage),
+        get_frame_count(log_file_path),
+    )
+
+
+def run_ffmpeg(arguments, log_file_path, args) -> Optional[ResourceUsage]:
+    """
+    Run FFmpeg with a progress bar, or without one if --resource-usage was specified,
+    as the resources used by a process can only be measured if VQM waits for it.
+    """
+    if args.resource_usage:
+        return run_process(arguments, log_file_path)
+
+    # Imported here rather than at startup, as better_ffmpeg_progress imports requests and rich, which are slow to import.
+    from better_ffmpeg_progress import FfmpegProcess
+
+    process = FfmpegProcess(
+        arguments,
+        ffmpeg_log_file=Path(log_file_path),
+        print_detected_duration=False,
+    )
+    # Rich can only display one live progress bar at a time, which is not enough when pipelining.
+    process.use_tqdm = args.pipeline
+    process.run()
+
+    return None
+
+
 def exit_program(message):
     line()
     log.info(f"{message}\nThis program will now exit.")
@@ -129,11 +357,29 @@ def force_decimal_places(value, decimal_places):
     return f"{value:.{decimal_places}f}"
 
 
+def format_bitrate(bits_per_second, decimal_places):
+    return f"{force_decimal_places(bits_per_second / 1_000_000, decimal_places)} Mbps"
+
+
 def line():
-    width, _ = os.get_terminal_size()
+    # Falls back to 80 columns when the output is not a terminal, e.g. for a worker that runs in the background.
+    width, _ = shutil.get_terminal_size()
     log.info("-" * width)
 
 
+def get_pyplot():
+    """
+    Import matplotlib when the first graph is plotted rather than at startup, as it is slow to import.
+    The non-interactive Agg backend is used as the graphs are only saved to files.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
 def plot_graph(
     title,
     x_label,
@@ -144,6 +390,8 @@ def plot_graph(
     save_path,
     bar_graph=False,
 ):
+    plt = get_pyplot()
+
     def generate_colors(n):
         """Generate n distinct colors by evenly spacing hues."""
         return [plt.cm.hsv(i / n) for i in range(n)]